@@ -1,5 +1,12 @@
 """Linux /proc filesystem API"""
 
+from procfs import proc, processes
 from procfs.core import Proc
+from procfs.processes import net
+from procfs.registry import PID, handlers, register
 
 __version__ = '0.5.0'
+
+# Built-in handlers
+handlers.register_package(proc)
+handlers.register_package(processes, PID + '/')
@@ -0,0 +1,167 @@
+"""TCP connection churn between socket table reads
+
+:class:`TcpChurnTracker` keeps the rows of the previous read, without
+their slot (a row number, which shifts when sockets come and go). Rows
+that did not change are skipped by string equality without being split
+or decoded, so only added, removed and changed rows are parsed:
+
+    >>> tracker = TcpChurnTracker()
+    >>> tracker.update()
+    >>> time.sleep(1)
+    >>> tracker.update().peers()['10.0.0.1'].opened_per_second
+    12.0
+
+Connections are identified by their inode and their local and remote
+addresses and ports. The kernel zeroes the inode of sockets entering
+TIME_WAIT, so a new row without inode is matched with the socket of the
+previous read with the same addresses and ports, and reported as changed.
+"""
+
+import time
+
+from procfs.core import Dict
+from procfs.exceptions import PathNotFoundError
+from procfs.processes.net import tcp, tcp6
+
+
+def _row(line):
+    """Split a socket table line into its slot and the rest of the row"""
+    slot, _, row = line.partition(':')
+    return slot, row
+
+
+class Churn(object):
+    """Connection changes between two reads.
+
+    ``added`` and ``removed`` are lists of
+    :class:`procfs.processes.net.SocketEntry`, ``changed`` a list of
+    ``(previous, current)`` entries of connections whose state changed.
+    """
+
+    def __init__(self, added, removed, changed, interval):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.interval = interval
+
+    def peers(self):
+        """Opened and closed connections per remote address.
+
+        Returns a :class:`procfs.core.Dict` of ``opened`` and ``closed``
+        counts and their ``opened_per_second`` and ``closed_per_second``
+        rates for each remote address. Listening sockets have no peer.
+        """
+        peers = Dict()
+        for name, entries in (('opened', self.added),
+                              ('closed', self.removed)):
+            for entry in entries:
+                if not entry.remote_port:
+                    continue
+                peer = peers.get(entry.remote_address)
+                if peer is None:
+                    peer = peers[entry.remote_address] = Dict(opened=0,
+                                                              closed=0)
+                peer[name] += 1
+        interval = float(self.interval) or 1.
+        for peer in peers.values():
+            peer.opened_per_second = peer.opened / interval
+            peer.closed_per_second = peer.closed / interval
+        return peers
+
+    def __repr__(self):
+        return '<Churn: %d added, %d removed, %d changed>' % \
+            (len(self.added), len(self.removed), len(self.changed))
+
+
+class TcpChurnTracker(object):
+    """Track TCP connections between successive reads.
+
+    ``tables`` are the socket table handlers to read, by default the tcp
+    and tcp6 tables of the current network namespace.
+    """
+
+    def __init__(self, tables=None):
+        if tables is None:
+            tables = []
+            for handler in (tcp, tcp6):
+                try:
+                    tables.append(handler('self'))
+                except PathNotFoundError:
+                    # No IPv6
+                    pass
+        self._tables = tables
+        # Row (without its slot) -> connection key
+        self._rows = {}
+        # Connection key -> (table, slot, row)
+        self._connections = {}
+        self._timestamp = None
+
+    def _entry(self, table, slot, row):
+        return table._parse_record([slot + ':'] + row.split())
+
+    def update(self, timestamp=None):
+        """Read the socket tables and return the :class:`Churn` since the
+           previous read, or ``None`` for the first read
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        previous_rows = self._rows
+        previous = self._connections
+        rows = {}
+        connections = {}
+        # Rows that are not in the previous read: (table, key, slot, row)
+        new_rows = []
+        for table in self._tables:
+            lines = table._iterlines()
+            next(lines, None)  # skip header
+            for line in lines:
+                slot, row = _row(line)
+                key = previous_rows.get(row)
+                if key is None:
+                    parts = row.split()
+                    if not parts:
+                        continue
+                    key = (parts[0], parts[1], parts[8])
+                    new_rows.append((table, key, slot, row))
+                rows[row] = key
+                connections[key] = (table, slot, row)
+
+        churn = None
+        if self._timestamp is not None:
+            added = []
+            changed = []
+            # Keys of the previous connections with an inode, by address
+            addresses = None
+            # Previous connections that entered TIME_WAIT
+            matched = set()
+            for table, key, slot, row in new_rows:
+                old = previous.get(key)
+                if old is None and key[2] == '0':
+                    if addresses is None:
+                        addresses = dict((old_key[:2], old_key)
+                                         for old_key in previous
+                                         if old_key[2] != '0')
+                    old_key = addresses.get(key[:2])
+                    if old_key is not None and old_key not in connections:
+                        old = previous[old_key]
+                        matched.add(old_key)
+                if old is None:
+                    added.append(self._entry(table, slot, row))
+                elif old[2].split(None, 3)[2] != row.split(None, 3)[2]:
+                    changed.append((self._entry(*old),
+                                    self._entry(table, slot, row)))
+            removed = [self._entry(*previous[key])
+                       for key in set(previous).difference(connections,
+                                                           matched)]
+            churn = Churn(added, removed, changed,
+                          timestamp - self._timestamp)
+        self._rows = rows
+        self._connections = connections
+        self._timestamp = timestamp
+        return churn
+
+    def reset(self):
+        """Forget the previous read"""
+        self._rows = {}
+        self._connections = {}
+        self._timestamp = None
@@ -19,6 +19,7 @@ from procfs.core import ProcDirectory
 from procfs.core import ProcessDirectory
 
 from procfs.exceptions import PathNotFoundError
+from procfs.records import Record
 
 
 class CustomEncoder(json.JSONEncoder):
@@ -26,6 +27,8 @@ class CustomEncoder(json.JSONEncoder):
         if isinstance(obj, timedelta):
             return ((obj.microseconds +
                      (obj.seconds + obj.days * 24 * 3600) * 10**6) // 10**6)
+        if isinstance(obj, Record):
+            return obj._asdict()
         return json.JSONEncoder.default(self, obj)
 
 
@@ -55,7 +58,7 @@ def find(path, list):
             obj = obj()
 
     if list:
-        if isinstance(obj, dict):
+        if isinstance(obj, (dict, Record)):
             return json.dumps(obj.keys(), cls=CustomEncoder)
         elif isinstance(obj, ProcDirectory) \
                 or isinstance(obj, ProcessDirectory):
@@ -0,0 +1,200 @@
+"""Connection counts and queue sums grouped by peer, port and state
+
+The columns needed for grouping are parsed from the socket tables into
+packed integer arrays: addresses as their 32-bit words (one for IPv4,
+four for IPv6) in the kernel's byte order, ports, states and queue
+sizes. Groups are computed on these integers at once, with NumPy when it
+is installed, :mod:`array` and dicts otherwise, and only the addresses of
+the resulting groups are decoded:
+
+    >>> by_peer = group(('remote_address', 'state'))
+    >>> by_peer['10.0.0.1', 'ESTABLISHED'].connections
+    42
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from procfs.core import Dict
+from procfs.exceptions import PathNotFoundError
+from procfs.processes import net
+from procfs.processes.net import TCP_STATES, decode_address
+
+
+ADDRESS_COLUMNS = ('local_address', 'remote_address')
+COLUMNS = ADDRESS_COLUMNS + ('local_port', 'remote_port', 'state')
+SUMS = ('tx_queue', 'rx_queue')
+
+
+class ConnectionTable(object):
+    """Socket table columns as packed integer arrays.
+
+    ``lines`` are the lines of a socket table, header included, and
+    ``tcp`` tells whether states are TCP states. ``width`` is the number
+    of 32-bit words of addresses. Columns are NumPy uint64 arrays, or
+    ``array('L')`` without NumPy; address columns hold ``width`` words
+    per socket.
+    """
+
+    def __init__(self, lines, tcp=True):
+        self.tcp = tcp
+        self.width = None
+        columns = dict((name, []) for name in COLUMNS + SUMS)
+        local_address = columns['local_address']
+        remote_address = columns['remote_address']
+        local_port = columns['local_port']
+        remote_port = columns['remote_port']
+        state = columns['state']
+        tx_queue = columns['tx_queue']
+        rx_queue = columns['rx_queue']
+        lines = iter(lines)
+        next(lines, None)  # skip header
+        for line in lines:
+            parts = line.split()
+            if not parts:
+                continue
+            local, remote, st, queues = parts[1:5]
+            if self.width is None:
+                self.width = (len(local) - 5) // 8
+            for index in range(0, len(local) - 5, 8):
+                local_address.append(int(local[index:index + 8], 16))
+                remote_address.append(int(remote[index:index + 8], 16))
+            local_port.append(int(local[-4:], 16))
+            remote_port.append(int(remote[-4:], 16))
+            state.append(int(st, 16))
+            tx_queue.append(int(queues[:8], 16))
+            rx_queue.append(int(queues[9:], 16))
+        self.width = self.width or 1
+        self.size = len(state)
+        for name, values in columns.items():
+            if numpy is not None:
+                values = numpy.array(values, dtype=numpy.uint64)
+            else:
+                values = array('L', values)
+            setattr(self, name, values)
+
+    def _key_columns(self, by):
+        """The integer columns of the ``by`` columns"""
+        keys = []
+        for name in by:
+            if name not in COLUMNS:
+                raise ValueError('unknown column: %s' % name)
+            values = getattr(self, name)
+            if name in ADDRESS_COLUMNS:
+                if numpy is not None and isinstance(values, numpy.ndarray):
+                    values = values.reshape(self.size, self.width)
+                    keys.extend(values[:, word] for word in range(self.width))
+                else:
+                    keys.extend(values[word::self.width]
+                                for word in range(self.width))
+            else:
+                keys.append(values)
+        return keys
+
+    def _decode(self, by, key):
+        """Decode the integers of a group key"""
+        values = []
+        index = 0
+        for name in by:
+            if name in ADDRESS_COLUMNS:
+                words = key[index:index + self.width]
+                values.append(decode_address(
+                    ''.join('%08X' % int(word) for word in words)))
+                index += self.width
+            else:
+                value = int(key[index])
+                if name == 'state':
+                    value = '%02X' % value
+                    if self.tcp:
+                        value = TCP_STATES.get(value, value)
+                values.append(value)
+                index += 1
+        return tuple(values)
+
+    def _numpy_groups(self, keys):
+        keys = numpy.column_stack(keys)
+        groups, inverse = numpy.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = numpy.bincount(inverse, minlength=len(groups))
+        sums = [numpy.bincount(inverse, weights=getattr(self, name),
+                               minlength=len(groups))
+                for name in SUMS]
+        return [(tuple(groups[index]), int(counts[index]),
+                 [int(values[index]) for values in sums])
+                for index in range(len(groups))]
+
+    def _array_groups(self, keys):
+        groups = {}
+        sums = [getattr(self, name) for name in SUMS]
+        for row, key in enumerate(zip(*keys)):
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0] + [0] * len(sums)
+            group[0] += 1
+            for index, values in enumerate(sums):
+                group[index + 1] += values[row]
+        return [(key, group[0], [int(value) for value in group[1:]])
+                for key, group in groups.items()]
+
+    def group(self, by):
+        """Count connections and sum their queues by the ``by`` columns.
+
+        Returns a :class:`procfs.core.Dict` mapping a tuple of the ``by``
+        values (addresses as text, ports as integers, states as names for
+        TCP) to the number of ``connections`` and their ``tx_queue`` and
+        ``rx_queue`` sums.
+        """
+        by = tuple(by)
+        keys = self._key_columns(by)
+        result = Dict()
+        if not self.size:
+            return result
+        if numpy is not None and isinstance(self.state, numpy.ndarray):
+            groups = self._numpy_groups(keys)
+        else:
+            groups = self._array_groups(keys)
+        for key, count, sums in groups:
+            result[self._decode(by, key)] = Dict(
+                zip(('connections',) + SUMS, [count] + sums))
+        return result
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '<ConnectionTable: %d sockets>' % self.size
+
+
+def group(by, tables=('tcp', 'tcp6'), pid='self'):
+    """Group the sockets of ``tables`` of the network namespace of
+       ``pid`` by the ``by`` columns (see :meth:`ConnectionTable.group`)
+    """
+    result = Dict()
+    for name in tables:
+        try:
+            handler = getattr(net, name)(pid)
+        except PathNotFoundError:
+            # No IPv6
+            continue
+        table = ConnectionTable(handler._iterlines(), name.startswith('tcp'))
+        for key, values in table.group(by).items():
+            if key in result:
+                for field, value in values.items():
+                    result[key][field] += value
+            else:
+                result[key] = values
+    return result
+
+
+def by_peer(tables=('tcp', 'tcp6'), pid='self'):
+    """Connections grouped by ``(remote_address, state)``"""
+    return group(('remote_address', 'state'), tables, pid)
+
+
+def by_port(tables=('tcp', 'tcp6'), pid='self'):
+    """Connections grouped by ``(local_port, state)``"""
+    return group(('local_port', 'state'), tables, pid)
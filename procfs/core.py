@@ -4,12 +4,25 @@ Base classes to handle an easy /proc navigation.
 import os
 import re
 import pwd
+import stat
+import threading
 from datetime import datetime
 from pprint import pformat
 
 from procfs.exceptions import PathNotFoundError, UnknownProcessError, \
     NoParentProcessError, PathNotADirectoryError, PathNotAFileError
-from procfs.utils import get_module
+from procfs.parallel import DEFAULT_CHUNKSIZE, map_processes
+from procfs.pool import FilePool, PinnedDirectory
+from procfs.records import Record
+from procfs.registry import PID, handlers
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 try:
     basestring
@@ -18,6 +31,9 @@ except:
 
 DIGIT = re.compile('^\d+$')
 
+# Clock ticks per second, the unit of CPU times in /proc
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
 
 def readfile(fn):
     """Read file contents"""
@@ -25,6 +41,97 @@ def readfile(fn):
         return f.read()
 
 
+def iterlines(fn, size=65536):
+    """Read a file by chunks of ``size`` characters and yield its lines"""
+    with open(fn) as f:
+        rest = ''
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                break
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+
+
+def list_pids():
+    """Return the IDs of running processes, sorted"""
+    return sorted(int(pid) for pid in os.listdir('/proc') if DIGIT.match(pid))
+
+
+class Snapshot(object):
+    """Read and parse each /proc file at most once.
+
+    While a snapshot is active (it is a context manager), every file whose
+    path lives under ``prefix`` is read once and parsed once per handler
+    class; later reads and attribute lookups share these results.
+
+    Parsed results are shared, so they should not be modified in place.
+    """
+
+    _active = threading.local()
+
+    def __init__(self, prefix='/proc'):
+        self._prefix = prefix.rstrip('/')
+        self._data = {}
+        self._parsed = {}
+
+    @classmethod
+    def _stack(cls):
+        stack = getattr(cls._active, 'stack', None)
+        if stack is None:
+            stack = cls._active.stack = []
+        return stack
+
+    @classmethod
+    def current(cls, path):
+        """Return the innermost active snapshot covering ``path``, if any.
+        """
+        for snapshot in reversed(cls._stack()):
+            if snapshot.covers(path):
+                return snapshot
+
+    def parsed(self, handler):
+        """Return the cached parse result of ``handler``'s file, if any
+        """
+        return self._parsed.get((handler._filepath, handler.__class__))
+
+    def covers(self, path):
+        return path == self._prefix or path.startswith(self._prefix + '/')
+
+    def read(self, handler, parse=True):
+        """Read (and parse) the file of ``handler``, using cached results
+        """
+        path = handler._filepath
+        if parse:
+            key = (path, handler.__class__)
+            if key not in self._parsed:
+                self._parsed[key] = handler._parse(self.read(handler, False))
+            return self._parsed[key]
+        if path not in self._data:
+            self._data[path] = handler._readfile()
+        return self._data[path]
+
+    def clear(self):
+        """Forget cached data, so next reads start a new sample."""
+        self._data.clear()
+        self._parsed.clear()
+
+    def __enter__(self):
+        self._stack().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack().remove(self)
+        self.clear()
+
+    def __repr__(self):
+        return '<Snapshot: %s>' % self._prefix
+
+
 class Dict(dict):
     """A dict with access to its items like if they are attributes.
     """
@@ -36,29 +143,72 @@ class Dict(dict):
 
 class BaseFile(object):
 
-    def __init__(self, filepath):
+    # Handlers able to parse a single field from the raw file content
+    # override this with a ``_parse_field(data, name)`` method, which
+    # raises KeyError for unknown fields.
+    _parse_field = None
+
+    def __init__(self, filepath, pool=None, check=True):
         if not isinstance(filepath, basestring):
             raise PathNotAFileError(filepath)
-        elif not os.path.exists(filepath):
-            raise PathNotFoundError(filepath)
-        elif not os.path.isfile(filepath):
+        # Directories check the type of their entries before creating them
+        if check and not stat.S_ISREG(_mode(filepath, True)):
             raise PathNotAFileError(filepath)
         self._filepath = filepath
+        self._pool = pool
+
+    def _readfile(self):
+        """Read file content, through the file pool if there is one."""
+        if self._pool is not None:
+            return self._pool.read(self._filepath)
+        return readfile(self._filepath)
 
     def _read(self, parse=True):
         """Read and parse file content."""
-        data = readfile(self._filepath)
+        snapshot = Snapshot.current(self._filepath)
+        if snapshot is not None:
+            return snapshot.read(self, parse)
+        data = self._readfile()
         if parse:
             return self._parse(data)
         else:
             return data
 
+    def _iterlines(self):
+        """Iterate over the lines of the file without reading it at once,
+           unless it is already in a snapshot or read through a pool
+        """
+        snapshot = Snapshot.current(self._filepath)
+        if snapshot is not None:
+            return iter(snapshot.read(self, False).splitlines())
+        if self._pool is not None:
+            return iter(self._pool.read(self._filepath).splitlines())
+        return iterlines(self._filepath)
+
+    def _read_field(self, name):
+        """Read and parse a single field of file content."""
+        snapshot = Snapshot.current(self._filepath)
+        if snapshot is not None:
+            parsed = snapshot.parsed(self)
+            if parsed is not None:
+                return parsed[name]
+            data = snapshot.read(self, False)
+        else:
+            data = self._readfile()
+        return self._parse_field(data, name)
+
     def __getattr__(self, attr):
         """Provide access to file content."""
         if isinstance(attr, int) or \
            (isinstance(attr, basestring) and not attr.startswith('_')):
+            if self._parse_field is not None and \
+               isinstance(attr, basestring) and not hasattr(Dict, attr):
+                try:
+                    return self._read_field(attr)
+                except KeyError:
+                    pass
             data = self._read()
-            if isinstance(data, dict) and attr in data:
+            if isinstance(data, (dict, Record)) and attr in data:
                 return data[attr]
             if isinstance(attr, basestring):
                 if hasattr(data, attr):
@@ -84,78 +234,108 @@ class BaseFile(object):
 
 class File(BaseFile):
     """A /proc virtual file
+
+    When a :class:`procfs.pool.FilePool` is given as ``pool``, the file is
+    kept open and re-read from the pool.
     """
 
-    def __init__(self, filepath=None):
+    def __init__(self, filepath=None, pool=None, check=True):
         if not filepath:
             name = self.__module__[len('procfs.proc.'):]
             filepath = '/proc/%s' % os.path.join(name.replace('.', '/'),
                                                  self.__class__.__name__)
-        super(File, self).__init__(filepath)
+        super(File, self).__init__(filepath, pool, check)
 
 
 class ProcessFile(BaseFile):
     """A /proc/<pid> file
+
+    ``pool`` is the :class:`procfs.pool.PinnedDirectory` of the process
+    directory of pinned processes.
     """
 
-    def __init__(self, id, filepath=None):
+    def __init__(self, id, filepath=None, pool=None, check=True):
         if not filepath:
             name = self.__module__[len('procfs.processes.'):]
             filepath = os.path.join(name.replace('.', '/'),
                                     self.__class__.__name__)
         filepath = '/proc/%s/%s' % (id, filepath)
-        super(ProcessFile, self).__init__(filepath)
+        super(ProcessFile, self).__init__(filepath, pool, check)
+        self._id = id
+
+
+def _mode(path, follow_symlinks=False):
+    """Return the file type bits of ``path``"""
+    try:
+        if follow_symlinks:
+            result = os.stat(path)
+        else:
+            result = os.lstat(path)
+        return stat.S_IFMT(result.st_mode)
+    except OSError:
+        raise PathNotFoundError(path)
 
 
 class BaseDirectory(object):
-    """Base directory class"""
+    """Base directory class
 
-    # Where to look for file handlers
-    _base_module = None
-    # How much parts of the directory path to skip when looking for file
-    # handlers
+    The type of an entry is known from a single ``lstat``, or from the
+    last listing of the directory (see :meth:`__dir__`), which may include
+    entries that no longer exist: reading them raises :class:`IOError`.
+    """
+
+    # How much parts of the directory path to skip to get its path
+    # relative to the directory of its handlers
     _skip_path_parts = None
 
     def __init__(self, path):
-        if not os.path.exists(path):
-            raise PathNotFoundError(path)
-        elif not os.path.isdir(path):
+        if not stat.S_ISDIR(_mode(path, True)):
             raise PathNotADirectoryError(path)
         self._dir = path
+        self._pattern = self._directory_pattern(path)
+        # Entry name -> file type bits, from the last listing
+        self._types = {}
 
     def __getattr__(self, attr):
-        path = os.path.join(self._dir, str(attr))
-        if not os.path.exists(path):
-            raise PathNotFoundError(path)
-        elif os.path.islink(path):
+        name = str(attr)
+        path = os.path.join(self._dir, name)
+        mode = self._types.get(name)
+        if mode is None:
+            mode = self._entry_mode(path)
+        if mode == stat.S_IFLNK:
+            if not self._exists(path):
+                # Dangling link
+                raise PathNotFoundError(path)
             return self._handle_link(path)
-        elif os.path.isdir(path):
+        elif mode == stat.S_IFDIR:
             return self._handle_directory(path)
         else:
             return self._handle_file(path)
     __getitem__ = __getattr__
 
+    def _directory_pattern(self, path):
+        """Return the registry pattern of the directory, as a prefix of
+           the patterns of its files (``'net/'``)
+        """
+        parts = path.split('/')[self._skip_path_parts:]
+        return ''.join(part + '/' for part in parts if part)
+
+    def _entry_mode(self, path):
+        """Return the file type bits of the entry ``path``"""
+        return _mode(path)
+
+    def _exists(self, path):
+        """Whether the entry ``path`` exists, following links"""
+        return os.path.exists(path)
+
     def _handle_directory(self, path):
         raise NotImplementedError
 
     def _handle_file(self, path):
         """Try to find a handler or return the raw file"""
-        dirname, handler_name = os.path.split(path)
-
-        # Skip /proc/<pid> from the directory path to find sub module name
-        dirname_parts = dirname.split('/')
-        sub_module_name = '.'.join(dirname_parts[self._skip_path_parts:])
-
-        if sub_module_name:
-            module_name = '%s.%s' % (self._base_module, sub_module_name)
-        else:
-            module_name = self._base_module
-        module = get_module(module_name)
-
-        # Use filename as handler name
-        if module and hasattr(module, handler_name):
-            handler = getattr(module, handler_name)
-            return self._call_file_handler(handler)
+        handler = handlers.lookup(self._pattern + os.path.basename(path))
+        if handler is not None:
+            return self._call_file_handler(handler, path)
         else:
             # If no handler is found,
             # returns a ProcessFile object
@@ -167,20 +347,36 @@ class BaseDirectory(object):
     def _handle_raw_file(self, path):
         return readfile(path)
 
-    def _call_file_handler(self, handler):
-        return handler()
+    def _call_file_handler(self, handler, path):
+        return handler(path, check=False)
 
     def __dir__(self):
-        return os.listdir(self._dir)
+        """List the directory, and remember the type of its entries"""
+        if scandir is None:
+            return os.listdir(self._dir)
+        types = {}
+        for entry in scandir(self._dir):
+            # Types come from the directory entries, without a stat
+            if entry.is_symlink():
+                types[entry.name] = stat.S_IFLNK
+            elif entry.is_dir(follow_symlinks=False):
+                types[entry.name] = stat.S_IFDIR
+            else:
+                types[entry.name] = stat.S_IFREG
+        self._types = types
+        return list(types)
 
 
 class ProcDirectory(BaseDirectory):
     """/proc and its sub-directories
     """
 
-    _base_module = 'procfs.proc'
     _skip_path_parts = 2
 
+    def __init__(self, path, pool=None):
+        self._pool = pool
+        super(ProcDirectory, self).__init__(path)
+
     def _handle_link(self, path):
         target = os.readlink(path)
         obj = self
@@ -189,20 +385,29 @@ class ProcDirectory(BaseDirectory):
         return obj
 
     def _handle_directory(self, path):
-        return ProcDirectory(path)
+        return ProcDirectory(path, self._pool)
 
     def _handle_raw_file(self, path):
-        return File(path)
+        return File(path, self._pool, check=False)
+
+    def _call_file_handler(self, handler, path):
+        return handler(path, pool=self._pool, check=False)
 
     def __repr__(self):
         return '<ProcDirectory: %s>' % self._dir
 
 
 class Proc(ProcDirectory):
-    """/proc"""
+    """/proc
+
+    With a positive ``pool_size``, /proc files are kept open in a
+    :class:`procfs.pool.FilePool` of that many descriptors and re-read
+    in place, which is cheaper for files sampled frequently.
+    """
 
-    def __init__(self):
-        super(Proc, self).__init__('/proc')
+    def __init__(self, pool_size=0):
+        pool = FilePool(pool_size) if pool_size else None
+        super(Proc, self).__init__('/proc', pool)
 
     def _handle_link(self, path):
         if path == '/proc/self':
@@ -217,15 +422,64 @@ class Proc(ProcDirectory):
         """
         return Processes()
 
+    def snapshot(self):
+        """Read each /proc file at most once within a ``with`` block
+        """
+        return Snapshot(self._dir)
+
+    def close(self):
+        """Close the pooled file descriptors, if any"""
+        if self._pool is not None:
+            self._pool.close()
+
     def __repr__(self):
         return '<Proc>'
 
 
+def _match_uid(pid, uid):
+    # /proc/<pid> is owned by the effective uid of the process, except for
+    # non-dumpable processes which are reported as owned by root.
+    owner = os.stat('/proc/%s' % pid).st_uid
+    if owner != 0:
+        return owner == uid
+    status_uid = Process(pid).status.Uid
+    return uid in (status_uid.real, status_uid.effective)
+
+
+def _match_name(pid, pattern):
+    return bool(pattern.search(Process(pid).stat.tcomm[1:-1]))
+
+
+def _match_cmdline(pid, pattern):
+    return bool(pattern.search(' '.join(Process(pid).cmdline())))
+
+
+def _match_all(pid, predicates):
+    for predicate, args in predicates:
+        if not predicate(pid, *args):
+            return False
+    return True
+
+
 class Processes(object):
-    """Process interface"""
+    """Process interface
 
-    def __init__(self):
+    Filters are lazy: they are only applied when processes are listed,
+    counted or scanned, cheapest first (see :attr:`_costs`), so that
+    expensive files are only read for the processes left by cheap
+    filters. Scans and filters run sequentially, unless an ``executor``
+    is given (see :mod:`procfs.parallel`).
+    """
+
+    # Relative cost of filters: a stat() of /proc/<pid>, a read of
+    # /proc/<pid>/stat, a read of /proc/<pid>/cmdline
+    _costs = {_match_uid: 0, _match_name: 1, _match_cmdline: 2}
+
+    def __init__(self, executor=None, chunksize=DEFAULT_CHUNKSIZE):
         self.__processes = None
+        self._predicates = []
+        self._executor = executor
+        self._chunksize = chunksize
 
     def __call__(self, id):
         return Process(id)
@@ -233,28 +487,96 @@ class Processes(object):
     def __getitem__(self, item):
         return self.all[item]
 
+    def __iter__(self):
+        return iter(self.all)
+
     def __len__(self):
         return len(self.all)
 
     @property
     def all(self):
+        if not self._predicates:
+            return [Process(pid) for pid in list_pids()]
         if self.__processes is None:
-            return [Process(pid) for pid in os.listdir('/proc')
-                    if DIGIT.match(pid)]
+            plan = sorted(self._predicates,
+                          key=lambda predicate: self._costs[predicate[0]])
+            matches = map_processes(_match_all, list_pids(), self._executor,
+                                    self._chunksize, (plan,))
+            self.__processes = [Process(pid)
+                                for pid, match in matches if match]
+        return self.__processes
+
+    def parallel(self, executor, chunksize=DEFAULT_CHUNKSIZE):
+        """Run the following scans and filters on ``executor``, in chunks
+           of ``chunksize`` processes
+        """
+        self._executor = executor
+        self._chunksize = chunksize
+        return self
+
+    def _filter(self, predicate, *args):
+        self._predicates.append((predicate, args))
+        self.__processes = None
+        return self
+
+    def scan(self, fields=None):
+        """Read ``fields`` of the processes in one pass, as columns.
+
+        See :func:`procfs.scanner.scan`.
+        """
+        from procfs import scanner
+        if fields is None:
+            fields = scanner.DEFAULT_FIELDS
+        if self._predicates:
+            pids = [process.id for process in self.all]
+        else:
+            pids = None
+        return scanner.scan(fields, pids, self._executor, self._chunksize)
+
+    def tree(self):
+        """Index the processes by parent, from one scan.
+
+        See :class:`procfs.tree.ProcessTree`.
+        """
+        from procfs import tree
+        return tree.ProcessTree(self.scan(tree.FIELDS))
+
+    def table(self, fields=None):
+        """Create a table of all processes, refreshed incrementally.
+
+        See :class:`procfs.table.ProcessTable`. Raises
+        :class:`ValueError` when processes are filtered.
+        """
+        from procfs import scanner, table
+        if self._predicates:
+            raise ValueError('process tables include every process')
+        if fields is None:
+            fields = scanner.DEFAULT_FIELDS
+        return table.ProcessTable(fields, self._executor, self._chunksize)
+
+    def memory(self):
+        """Read the PSS and USS of the processes, on a thread pool unless
+           an executor is set with :meth:`parallel`.
+
+        See :func:`procfs.memory.memory_report`.
+        """
+        from procfs import memory
+        if self._predicates:
+            pids = [process.id for process in self.all]
         else:
-            return self.__processes
+            pids = None
+        return memory.memory_report(pids, self._executor, self._chunksize)
 
     def uid(self, uid=None):
-        """Filter processes by uid"""
+        """Filter processes by uid
+
+        Processes match when they are owned by ``uid`` (their effective
+        uid), or when ``uid`` is the real or effective uid of a
+        non-dumpable process.
+        """
         if uid is None:
             uid = os.getuid()
-        processes = []
-        for process in self.all:
-            status_uid = process.status.Uid
-            if uid in (status_uid.real, status_uid.effective):
-                processes.append(process)
-        self.__processes = processes
-        return self
+        return self._filter(_match_uid, uid)
 
     def user(self, name=None):
         """Filter processes by username"""
@@ -264,19 +586,21 @@ class Processes(object):
             uid = None
         return self.uid(uid)
 
+    def name(self, pattern):
+        """Filter processes by applying a regexp ``pattern`` to their
+           command name, from /proc/<pid>/stat
+        """
+        if isinstance(pattern, basestring):
+            pattern = re.compile(pattern)
+        return self._filter(_match_name, pattern)
+
     def cmdline(self, pattern):
         """Filter processes by applyinf a regexp ``pattern`` to
            /proc/<pid>/cmdline
         """
         if isinstance(pattern, basestring):
             pattern = re.compile(pattern)
-        processes = []
-        for process in self.all:
-            cmdline = ' '.join(process.cmdline())
-            if pattern.search(cmdline):
-                processes.append(process)
-        self.__processes = processes
-        return self
+        return self._filter(_match_cmdline, pattern)
 
     def __repr__(self):
         count = len(self)
@@ -290,22 +614,50 @@ class ProcessDirectory(BaseDirectory):
     """/proc/<pid>/<path>
     """
 
-    _base_module = 'procfs.processes'
     _skip_path_parts = 3
 
-    def __init__(self, id, path):
+    def __init__(self, id, path, pool=None):
         self._id = int(id)
+        self._pool = pool
         super(ProcessDirectory, self).__init__(path)
 
+    def _directory_pattern(self, path):
+        parts = [part for part in path.split('/')[self._skip_path_parts:]
+                 if part]
+        # Thread directories (task/<tid>) have the files of processes
+        while parts[:1] == ['task'] and len(parts) > 1 and \
+                parts[1].isdigit():
+            parts = parts[2:]
+        return ''.join(part + '/' for part in [PID] + parts)
+
     def _handle_directory(self, path):
-        return ProcessDirectory(self._id, path)
+        # Handlers may provide their own directory class
+        directory = handlers.lookup(
+            self._pattern + os.path.basename(path)) or ProcessDirectory
+        return directory(self._id, path, self._pool)
+
+    def _entry_mode(self, path):
+        if self._pool is not None:
+            return self._pool.mode(path)
+        return _mode(path)
+
+    def _exists(self, path):
+        if self._pool is not None:
+            return self._pool.exists(path)
+        return os.path.exists(path)
+
+    def _handle_link(self, path):
+        if self._pool is not None:
+            return self._pool.readlink(path)
+        return os.readlink(path)
 
     def _handle_raw_file(self, path):
         path = os.path.join(*path.split('/')[3:])
-        return ProcessFile(self._id, path)
+        return ProcessFile(self._id, path, self._pool, check=False)
 
-    def _call_file_handler(self, handler):
-        return handler(self._id)
+    def _call_file_handler(self, handler, path):
+        return handler(self._id, os.path.join(*path.split('/')[3:]),
+                       check=False, pool=self._pool)
 
     def __repr__(self):
         return '<ProcessDirectory: %s>' % self._dir
@@ -313,13 +665,42 @@ class ProcessDirectory(BaseDirectory):
 
 class Process(ProcessDirectory):
     """Process information from /proc/<pid>
+
+    A ``pinned`` process keeps its /proc/<pid> directory open and reads
+    its files relative to it (see :class:`procfs.pool.PinnedDirectory`):
+    they are always the files of the process it was created for, and
+    :class:`procfs.exceptions.ProcessGoneError` is raised once it exited,
+    even if its pid was reused. Pinned processes should be closed.
     """
 
-    def __init__(self, id):
+    def __init__(self, id, pinned=False):
         path = '/proc/%s' % id
-        if not os.path.isdir(path):
+        try:
+            pool = PinnedDirectory(path, int(id)) if pinned else None
+        except (ValueError, OSError):
             raise UnknownProcessError(id)
-        super(Process, self).__init__(id, path)
+        try:
+            super(Process, self).__init__(id, path, pool)
+        except (ValueError, PathNotFoundError, PathNotADirectoryError):
+            if pool is not None:
+                pool.close()
+            raise UnknownProcessError(id)
+
+    @property
+    def pinned(self):
+        """Whether the process directory is kept open"""
+        return self._pool is not None
+
+    def close(self):
+        """Close the process directory of a pinned process"""
+        if self._pool is not None:
+            self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def __repr__(self):
         return '<Process %s: %s>' % (self._id, self.status.Name)
@@ -328,6 +709,11 @@ class Process(ProcessDirectory):
     def id(self):
         return self._id
 
+    def snapshot(self):
+        """Read each /proc/<pid> file at most once within a ``with`` block
+        """
+        return Snapshot(self._dir)
+
     @property
     def parent(self):
         """The process' parent
@@ -341,12 +727,12 @@ class Process(ProcessDirectory):
     def started_at(self):
         """The time at which the process was started
         """
-        stat = os.stat(self._dir)
-        return datetime.fromtimestamp(stat.st_atime)
+        if self._pool is not None:
+            result = os.fstat(self._pool.fileno())
+        else:
+            result = os.stat(self._dir)
+        return datetime.fromtimestamp(result.st_atime)
 
     @property
     def uptime(self):
         return datetime.now() - self.started_at
-
-    def _handle_link(self, path):
-        return os.readlink(path)
@@ -0,0 +1,128 @@
+"""Per-CPU utilization from /proc/stat
+
+The cpu lines of /proc/stat are parsed into one (ncpu x nfield) matrix of
+clock ticks, and utilization between two samples is computed for all
+CPUs at once. NumPy is used when it is installed, :mod:`array` otherwise.
+"""
+
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from procfs.core import Dict
+from procfs.proc import stat
+from procfs.sampler import Sampler
+
+
+# Columns of the cpu lines of /proc/stat. guest and guest_nice are already
+# accounted in user and nice, so only the first TOTAL_FIELDS make a total.
+FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq',
+          'steal', 'guest', 'guest_nice')
+TOTAL_FIELDS = 8
+IDLE_FIELDS = [FIELDS.index('idle'), FIELDS.index('iowait')]
+
+
+class CpuSample(object):
+    """CPU times read from /proc/stat at ``timestamp``.
+
+    ``names`` lists the cpu lines, the aggregated ``cpu`` line first.
+    ``ticks`` holds their values in clock ticks: a NumPy int64 array of
+    shape (len(names), len(FIELDS)), or a flat ``array('l')`` in row-major
+    order without NumPy. Missing columns (older kernels) are zeros.
+    """
+
+    def __init__(self, content, timestamp=None):
+        width = len(FIELDS)
+        names = []
+        values = []
+        for line in content.splitlines():
+            if not line.startswith('cpu'):
+                break
+            parts = line.split()
+            names.append(parts[0])
+            row = [int(value) for value in parts[1:width + 1]]
+            values.extend(row)
+            values.extend([0] * (width - len(row)))
+        self.names = names
+        if numpy is not None:
+            self.ticks = numpy.array(values, dtype=numpy.int64)
+            self.ticks.shape = (len(names), width)
+        else:
+            self.ticks = array('l', values)
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __repr__(self):
+        return '<CpuSample: %d cpus>' % (len(self.names) - 1)
+
+
+class CpuUtilization(object):
+    """CPU utilization between two samples, in percent.
+
+    ``percent`` is a (len(names), len(FIELDS)) matrix (a NumPy array, or a
+    list of ``array('d')`` rows), and ``busy`` the percentage of time not
+    spent idle or waiting for I/O, for each CPU.
+    """
+
+    def __init__(self, names, percent, busy, interval):
+        self.names = names
+        self.percent = percent
+        self.busy = busy
+        self.interval = interval
+
+    def __getitem__(self, name):
+        index = self.names.index(name)
+        result = Dict(zip(FIELDS, (float(value)
+                                   for value in self.percent[index])))
+        result.busy = float(self.busy[index])
+        return result
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __repr__(self):
+        return '<CpuUtilization: %d cpus, %.1f%% busy>' % \
+            (len(self.names) - 1, self.busy[0])
+
+
+def utilization(before, after):
+    """Return the :class:`CpuUtilization` between two :class:`CpuSample`
+    """
+    if before.names != after.names:
+        raise ValueError('CPUs changed between samples')
+    interval = after.timestamp - before.timestamp
+    if numpy is not None and isinstance(after.ticks, numpy.ndarray):
+        delta = after.ticks - before.ticks
+        total = delta[:, :TOTAL_FIELDS].sum(axis=1)
+        busy = total - delta[:, IDLE_FIELDS].sum(axis=1)
+        total[total == 0] = 1
+        percent = delta * 100.0 / total[:, numpy.newaxis]
+        busy = busy * 100.0 / total
+        return CpuUtilization(after.names, percent, busy, interval)
+
+    width = len(FIELDS)
+    percent = []
+    busy = array('d')
+    for start in range(0, len(after.ticks), width):
+        delta = [new - old for new, old in
+                 zip(after.ticks[start:start + width],
+                     before.ticks[start:start + width])]
+        total = sum(delta[:TOTAL_FIELDS])
+        idle = sum(delta[index] for index in IDLE_FIELDS)
+        total = total or 1
+        percent.append(array('d', (value * 100.0 / total for value in delta)))
+        busy.append((total - idle) * 100.0 / total)
+    return CpuUtilization(after.names, percent, busy, interval)
+
+
+class CpuSampler(Sampler):
+    """Read /proc/stat and return the :class:`CpuUtilization` since the
+       last read (see :class:`procfs.sampler.Sampler`)
+    """
+
+    _handler = stat
+    _sample = CpuSample
+    _compare = staticmethod(utilization)
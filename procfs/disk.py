@@ -0,0 +1,235 @@
+"""iostat-like block device metrics from /proc/diskstats
+
+Counters of all devices are stored in one (ndevice x ncounter) matrix,
+indexed by device, and metrics between two samples are computed for all
+devices at once, with the same formulas on NumPy column vectors when it
+is installed, and on lists otherwise.
+"""
+
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from procfs.core import Dict
+from procfs.proc import diskstats
+from procfs.sampler import Sampler
+
+
+# Counter columns, as named by the diskstats handler
+COUNTERS = tuple(key.replace('__', '_') for key in diskstats.KEYS)
+(READS, READ_MERGES, READ_SECTORS, READ_MS,
+ WRITES, WRITE_MERGES, WRITE_SECTORS, WRITE_MS,
+ IN_PROGRESS, IO_MS, WEIGHTED_MS,
+ DISCARDS, DISCARD_MERGES, DISCARD_SECTORS, DISCARD_MS,
+ FLUSHES, FLUSH_MS) = range(len(COUNTERS))
+
+# Sectors are always 512 bytes in /proc/diskstats
+SECTOR_KB = 0.5
+
+METRICS = ('r/s', 'w/s', 'd/s', 'f/s', 'rrqm/s', 'wrqm/s', 'rkB/s', 'wkB/s',
+           'dkB/s', 'r_await', 'w_await', 'd_await', 'f_await', 'await',
+           'avgqu-sz', '%util')
+
+
+class DiskSample(object):
+    """Counters read from /proc/diskstats at ``timestamp``.
+
+    ``devices`` lists device names, ``index`` maps them to their row in
+    ``counters``: a NumPy int64 array of shape (len(devices),
+    len(COUNTERS)), or a flat ``array('l')`` in row-major order without
+    NumPy. Counters missing on older kernels are zeros.
+    """
+
+    def __init__(self, content, timestamp=None):
+        width = len(COUNTERS)
+        devices = []
+        values = []
+        for line in content.splitlines():
+            parts = line.split()
+            devices.append(parts[2])
+            row = [int(value) for value in parts[3:3 + width]]
+            values.extend(row)
+            values.extend([0] * (width - len(row)))
+        self.devices = devices
+        self.index = dict((device, row) for row, device in enumerate(devices))
+        if numpy is not None:
+            self.counters = numpy.array(values, dtype=numpy.int64)
+            self.counters.shape = (len(devices), width)
+        else:
+            self.counters = array('l', values)
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __repr__(self):
+        return '<DiskSample: %d devices>' % len(self.devices)
+
+
+class DiskMetrics(object):
+    """Block device metrics between two samples.
+
+    ``metrics`` maps each of :data:`METRICS` to a column of values (a NumPy
+    array or an ``array('d')``), in the order of ``devices``.
+    """
+
+    def __init__(self, devices, metrics, interval):
+        self.devices = devices
+        self.index = dict((device, row) for row, device in enumerate(devices))
+        self.metrics = metrics
+        self.interval = interval
+
+    def __getitem__(self, device):
+        row = self.index[device]
+        return Dict((name, float(self.metrics[name][row]))
+                    for name in METRICS)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __repr__(self):
+        return '<DiskMetrics: %d devices>' % len(self.devices)
+
+
+def _common_devices(before, after):
+    if before.devices == after.devices:
+        return after.devices, None, None
+    devices = [device for device in after.devices if device in before.index]
+    return (devices, [before.index[device] for device in devices],
+            [after.index[device] for device in devices])
+
+
+class _NumpyColumns(object):
+    """Metric arithmetic on the NumPy column vectors of counter deltas"""
+
+    def __init__(self, delta):
+        self._delta = delta
+
+    def __call__(self, index):
+        return self._delta[:, index]
+
+    @staticmethod
+    def add(*columns):
+        return sum(columns[1:], columns[0])
+
+    @staticmethod
+    def scale(column, factor):
+        return column * factor
+
+    @staticmethod
+    def ratio(numerator, denominator):
+        return numpy.where(denominator > 0,
+                           numerator / numpy.maximum(denominator, 1), 0.)
+
+    @staticmethod
+    def clip(column, limit):
+        return numpy.minimum(column, limit)
+
+    @staticmethod
+    def result(column):
+        return column
+
+
+class _ListColumns(object):
+    """Metric arithmetic on lists of counter deltas, one per device"""
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __call__(self, index):
+        return [row[index] for row in self._rows]
+
+    @staticmethod
+    def add(*columns):
+        return [sum(values) for values in zip(*columns)]
+
+    @staticmethod
+    def scale(column, factor):
+        return [value * factor for value in column]
+
+    @staticmethod
+    def ratio(numerator, denominator):
+        return [value / count if count else 0.
+                for value, count in zip(numerator, denominator)]
+
+    @staticmethod
+    def clip(column, limit):
+        return [min(value, limit) for value in column]
+
+    @staticmethod
+    def result(column):
+        return array('d', column)
+
+
+def _metrics(column, interval):
+    """Compute :data:`METRICS` from the counter deltas of ``column``, a
+       :class:`_NumpyColumns` or :class:`_ListColumns`
+    """
+    scale, ratio = column.scale, column.ratio
+
+    def per_second(index, factor=1.):
+        return scale(column(index), factor / interval)
+
+    metrics = {
+        'r/s': per_second(READS),
+        'w/s': per_second(WRITES),
+        'd/s': per_second(DISCARDS),
+        'f/s': per_second(FLUSHES),
+        'rrqm/s': per_second(READ_MERGES),
+        'wrqm/s': per_second(WRITE_MERGES),
+        'rkB/s': per_second(READ_SECTORS, SECTOR_KB),
+        'wkB/s': per_second(WRITE_SECTORS, SECTOR_KB),
+        'dkB/s': per_second(DISCARD_SECTORS, SECTOR_KB),
+        'r_await': ratio(column(READ_MS), column(READS)),
+        'w_await': ratio(column(WRITE_MS), column(WRITES)),
+        'd_await': ratio(column(DISCARD_MS), column(DISCARDS)),
+        'f_await': ratio(column(FLUSH_MS), column(FLUSHES)),
+        # Like iostat, flushes are left out
+        'await': ratio(
+            column.add(column(READ_MS), column(WRITE_MS),
+                       column(DISCARD_MS)),
+            column.add(column(READS), column(WRITES), column(DISCARDS))),
+        'avgqu-sz': per_second(WEIGHTED_MS, 1 / 1000.),
+        '%util': column.clip(per_second(IO_MS, 1 / 10.), 100.),
+    }
+    return dict((name, column.result(values))
+                for name, values in metrics.items())
+
+
+def metrics(before, after):
+    """Return the :class:`DiskMetrics` between two :class:`DiskSample`.
+
+    Devices that appeared between the samples are left out.
+    """
+    interval = float(after.timestamp - before.timestamp)
+    if interval <= 0:
+        raise ValueError('samples are not in chronological order')
+    devices, old_rows, new_rows = _common_devices(before, after)
+    if numpy is not None and isinstance(after.counters, numpy.ndarray):
+        old, new = before.counters, after.counters
+        if old_rows is not None:
+            old, new = old[old_rows], new[new_rows]
+        column = _NumpyColumns((new - old).astype(numpy.float64))
+    else:
+        width = len(COUNTERS)
+        if old_rows is None:
+            old_rows = new_rows = range(len(devices))
+        rows = []
+        for old_row, new_row in zip(old_rows, new_rows):
+            old = before.counters[old_row * width:(old_row + 1) * width]
+            new = after.counters[new_row * width:(new_row + 1) * width]
+            rows.append([float(value - previous)
+                         for value, previous in zip(new, old)])
+        column = _ListColumns(rows)
+    return DiskMetrics(devices, _metrics(column, interval), interval)
+
+
+class DiskSampler(Sampler):
+    """Read /proc/diskstats and return the :class:`DiskMetrics` since the
+       last read (see :class:`procfs.sampler.Sampler`)
+    """
+
+    _handler = diskstats
+    _sample = DiskSample
+    _compare = staticmethod(metrics)
@@ -23,3 +23,7 @@ class UnknownProcessError(ProcessException):
 
 class NoParentProcessError(ProcessException):
     """The process has no parent process"""
+
+
+class ProcessGoneError(UnknownProcessError):
+    """The process exited since its /proc directory was opened"""
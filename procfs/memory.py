@@ -0,0 +1,209 @@
+"""System-wide PSS and USS memory accounting
+
+RSS counts shared pages in every process that maps them. The
+proportional set size (PSS) divides each shared page between the
+processes sharing it, and the unique set size (USS) only counts private
+pages, so that they can be summed across processes:
+
+    >>> report = memory_report()
+    >>> report.by_comm()['postgres'].pss
+    1843200
+
+Memory is read from /proc/<pid>/smaps_rollup, or /proc/<pid>/smaps on
+kernels older than 4.14, for every process, by a thread pool unless
+another executor is given (see :mod:`procfs.parallel`). Sizes are in kB.
+"""
+
+import os
+import time
+from array import array
+
+from procfs import core
+from procfs.core import Dict, list_pids
+from procfs.parallel import DEFAULT_CHUNKSIZE, map_processes, thread_pool
+from procfs.processes import sum_smaps
+from procfs.scanner import scan
+from procfs.tree import ProcessTree
+
+
+FIELDS = ('rss', 'pss', 'uss', 'swap')
+
+# Table columns of FIELDS, apart from the scanned rss, in pages
+COLUMNS = tuple(field + '_kb' for field in FIELDS)
+
+# Chunk size of the default thread pool: reading smaps is slow, and the
+# kernel computes it while it is read, without holding the GIL
+POOL_CHUNKSIZE = 8
+
+# smaps fields summed to compute FIELDS
+_SMAPS_FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty',
+                 'Private_Hugetlb', 'Swap')
+
+# Fields scanned for each process, tree.FIELDS included
+_SCAN_FIELDS = ('pid', 'ppid', 'start_time', 'utime', 'stime', 'rss', 'uid',
+                'comm')
+
+
+def read_memory(pid):
+    """Return the ``(rss, pss, uss, swap, rollup)`` of ``pid``, in kB, and
+       whether they were read from smaps_rollup, or ``None`` for
+       processes without memory (kernel threads)
+    """
+    try:
+        data = core.readfile('/proc/%s/smaps_rollup' % pid)
+        rollup = True
+    except (IOError, OSError):
+        if os.path.exists('/proc/%s/smaps_rollup' % pid):
+            raise
+        data = core.readfile('/proc/%s/smaps' % pid)
+        rollup = False
+    totals = sum_smaps(data.splitlines(), lambda pathname: None,
+                       _SMAPS_FIELDS).get(None)
+    if totals is None:
+        return None
+    return (totals['Rss'], totals['Pss'],
+            totals['Private_Clean'] + totals['Private_Dirty'] +
+            totals['Private_Hugetlb'],
+            totals['Swap'], rollup)
+
+
+class MemoryReport(object):
+    """Memory usage of processes.
+
+    ``table`` holds one column per field, ordered by pid: ``pid``,
+    ``ppid``, ``uid``, ``start_time``, ``utime``, ``stime``, ``rss`` (in
+    pages, like :func:`procfs.scanner.scan`) and :data:`COLUMNS` (the
+    :data:`FIELDS` in kB) in ``array('l')``, and ``comm`` in a list.
+
+    ``cost`` describes the collection: its duration in ``seconds`` and
+    ``cpu_seconds`` (of this process), the number of ``processes`` read
+    from ``rollup`` (smaps_rollup) or ``smaps``, and the number of
+    processes ``skipped`` because they exited, could not be read or have
+    no memory (kernel threads).
+    """
+
+    def __init__(self, table, cost):
+        self.table = table
+        self.cost = cost
+        self._index = dict((pid, row) for row, pid in enumerate(table.pid))
+        self._tree = None
+
+    def __len__(self):
+        return len(self.table.pid)
+
+    def __iter__(self):
+        return iter(self.table.pid)
+
+    def __contains__(self, pid):
+        return pid in self._index
+
+    def _row(self, row):
+        return [self.table[column][row] for column in COLUMNS]
+
+    def process(self, pid):
+        """Memory usage of a process"""
+        row = self._index[pid]
+        result = Dict(zip(FIELDS, self._row(row)))
+        result.comm = self.table.comm[row]
+        result.uid = self.table.uid[row]
+        return result
+
+    def _group(self, keys):
+        result = Dict()
+        for row, key in enumerate(keys):
+            totals = result.get(key)
+            if totals is None:
+                totals = result[key] = Dict.fromkeys(FIELDS, 0)
+                totals.processes = 0
+            totals.processes += 1
+            for field, value in zip(FIELDS, self._row(row)):
+                totals[field] += value
+        return result
+
+    def by_user(self):
+        """Memory usage summed by uid"""
+        return self._group(self.table.uid)
+
+    def by_comm(self):
+        """Memory usage summed by command name"""
+        return self._group(self.table.comm)
+
+    @property
+    def tree(self):
+        """The :class:`procfs.tree.ProcessTree` of the processes"""
+        if self._tree is None:
+            self._tree = ProcessTree(self.table)
+        return self._tree
+
+    def by_tree(self):
+        """Memory usage of each process and its descendants.
+
+        Processes whose memory could not be read are not in the tree, and
+        their children are roots.
+        """
+        tree = self.tree
+        order = []
+        for root in tree.roots:
+            order.extend(tree.subtree(root))
+        result = Dict()
+        # Children come after their parent in ``order``
+        for pid in reversed(order):
+            totals = Dict(zip(FIELDS, self._row(self._index[pid])))
+            totals.processes = 1
+            for child in tree.children(pid):
+                for field, value in result[child].items():
+                    totals[field] += value
+            result[pid] = totals
+        return result
+
+    def __repr__(self):
+        return '<MemoryReport: %d processes, %.1fs>' % \
+            (len(self), self.cost.seconds)
+
+
+def memory_report(pids=None, executor=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Read the memory usage of processes, all of them by default, and
+       return a :class:`MemoryReport`.
+
+    Processes are read by ``executor`` by chunks of ``chunksize`` pids, or
+    by a thread pool of one thread per CPU, by chunks of at most
+    :data:`POOL_CHUNKSIZE` pids, if it is ``None``.
+    """
+    started = time.time()
+    cpu_started = sum(os.times()[:2])
+    if pids is None:
+        pids = list_pids()
+    else:
+        pids = sorted(int(pid) for pid in pids)
+
+    pool = None
+    if executor is None:
+        executor = pool = thread_pool()
+        chunksize = min(chunksize, POOL_CHUNKSIZE)
+    try:
+        memory = [(pid, values) for pid, values in
+                  map_processes(read_memory, pids, executor, chunksize)
+                  if values is not None]
+        table = scan(_SCAN_FIELDS, [pid for pid, _ in memory], executor,
+                     chunksize)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    # Processes that exited since their memory was read are not scanned
+    memory = dict(memory)
+    columns = dict((column, array('l')) for column in COLUMNS)
+    rollups = 0
+    for pid in table.pid:
+        values = memory[pid]
+        for column, value in zip(COLUMNS, values):
+            columns[column].append(value)
+        rollups += values[-1]
+    table.update(columns)
+
+    cost = Dict(seconds=time.time() - started,
+                cpu_seconds=sum(os.times()[:2]) - cpu_started,
+                processes=len(table.pid), rollup=rollups,
+                smaps=len(table.pid) - rollups,
+                skipped=len(pids) - len(table.pid))
+    return MemoryReport(table, cost)
@@ -0,0 +1,228 @@
+"""Socket tables from the kernel's NETLINK_SOCK_DIAG interface
+
+Instead of formatting every socket as text in /proc/net/tcp, the kernel
+can dump them as binary ``inet_diag_msg`` structures, and filter them by
+state before sending them:
+
+    >>> from procfs import netlink
+    >>> listening = list(netlink.records('tcp', state='LISTEN'))
+
+:func:`records` yields the same :class:`procfs.processes.net.SocketEntry`
+as the /proc handlers, and falls back to parsing /proc/self/net when the
+netlink socket cannot be used. Both describe the network namespace of the
+calling process.
+"""
+
+import errno
+import os
+import socket
+import struct
+
+from procfs.core import CLK_TCK
+from procfs.processes import net
+from procfs.processes.net import SocketEntry, TCP_STATES, \
+    predicate_tokens, state_token
+from procfs.utils import BoundedCache
+
+
+# From Linux kernel headers: linux/netlink.h, linux/sock_diag.h and
+# linux/inet_diag.h
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+ALL_STATES = 0xffffffff
+
+# Socket tables available through netlink: (family, protocol)
+PROTOCOLS = {
+    'tcp': (socket.AF_INET, socket.IPPROTO_TCP),
+    'tcp6': (socket.AF_INET6, socket.IPPROTO_TCP),
+    'udp': (socket.AF_INET, socket.IPPROTO_UDP),
+    'udp6': (socket.AF_INET6, socket.IPPROTO_UDP),
+}
+
+# struct nlmsghdr
+_HEADER = struct.Struct('=IHHII')
+# struct inet_diag_req_v2, with a zeroed struct inet_diag_sockid
+_REQUEST = struct.Struct('=BBBBI48x')
+# struct inet_diag_msg: family, state, timer and retransmits, the socket
+# ID (ports and addresses in network byte order), then expires (in
+# milliseconds), rqueue, wqueue, uid and inode
+_MESSAGE = struct.Struct('=BBBB')
+_SOCKET_ID = struct.Struct('>HH16s16s12x')
+_COUNTERS = struct.Struct('=IIIII')
+_ERROR = struct.Struct('=i')
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+class SockDiag(object):
+    """A NETLINK_SOCK_DIAG socket
+
+    Raises :class:`socket.error` when netlink sockets are not available.
+    """
+
+    def __init__(self, bufsize=65536):
+        family = getattr(socket, 'AF_NETLINK', None)
+        if family is None:
+            raise socket.error(errno.EAFNOSUPPORT,
+                               os.strerror(errno.EAFNOSUPPORT))
+        self._socket = socket.socket(family, socket.SOCK_DGRAM,
+                                     NETLINK_SOCK_DIAG)
+        self._socket.bind((0, 0))
+        self._bufsize = bufsize
+        self._sequence = 0
+
+    def dump(self, family, protocol, states=ALL_STATES):
+        """Request the sockets of ``family`` and ``protocol`` in
+           ``states`` (a bit mask of kernel state codes), and return an
+           iterator of their ``(inet_diag_msg, socket ID, counters)``
+           tuples.
+
+        The first reply is received before returning, so that errors are
+        raised by this method rather than while iterating.
+        """
+        self._sequence += 1
+        request = _REQUEST.pack(family, protocol, 0, 0, states)
+        header = _HEADER.pack(_HEADER.size + len(request),
+                              SOCK_DIAG_BY_FAMILY,
+                              NLM_F_REQUEST | NLM_F_DUMP, self._sequence, 0)
+        self._socket.sendto(header + request, (0, 0))
+        return self._messages(*parse_messages(
+            self._socket.recv(self._bufsize)))
+
+    def _messages(self, messages, done):
+        while True:
+            for message in messages:
+                yield message
+            if done:
+                return
+            messages, done = parse_messages(self._socket.recv(self._bufsize))
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_messages(data):
+    """Return the ``(inet_diag_msg, socket ID, counters)`` tuples of a
+       netlink reply, and whether it ends the dump.
+
+    Raises :class:`OSError` when the kernel replied with an error.
+    """
+    messages = []
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, type_, _, _, _ = _HEADER.unpack_from(data, offset)
+        payload = offset + _HEADER.size
+        if type_ == NLMSG_DONE:
+            return messages, True
+        if type_ == NLMSG_ERROR:
+            error = -_ERROR.unpack_from(data, payload)[0]
+            raise OSError(error, os.strerror(error))
+        if type_ == SOCK_DIAG_BY_FAMILY:
+            messages.append((
+                _MESSAGE.unpack_from(data, payload),
+                _SOCKET_ID.unpack_from(data, payload + _MESSAGE.size),
+                _COUNTERS.unpack_from(data, payload + _MESSAGE.size +
+                                      _SOCKET_ID.size)))
+        offset += _align(length) or len(data)
+    return messages, False
+
+
+class _AddressCache(object):
+    """Text of packed addresses, cached like
+       :class:`procfs.processes.net.AddressDecoder`
+    """
+
+    def __init__(self, maxsize=256):
+        self._cache = BoundedCache(maxsize)
+
+    def __call__(self, family, packed):
+        text = self._cache.get((family, packed))
+        if text is None:
+            size = 4 if family == socket.AF_INET else 16
+            text = socket.inet_ntop(family, packed[:size])
+            self._cache[(family, packed)] = text
+        return text
+
+
+_addresses = _AddressCache()
+
+
+def _entries(diag, messages, tcp, local_port, remote_port, uid):
+    local_ports = predicate_tokens(local_port, int)
+    remote_ports = predicate_tokens(remote_port, int)
+    uids = predicate_tokens(uid, int)
+    try:
+        for slot, message in enumerate(messages):
+            ((family, state, timer, retransmits),
+             (sport, dport, src, dst),
+             (expires, rqueue, wqueue, owner, inode)) = message
+            if local_ports is not None and sport not in local_ports:
+                continue
+            if remote_ports is not None and dport not in remote_ports:
+                continue
+            if uids is not None and owner not in uids:
+                continue
+            state = '%02X' % state
+            if tcp and state == '0A':
+                # The backlog limit of listening sockets, not a queue
+                wqueue = 0
+            yield SocketEntry(slot, _addresses(family, src), sport,
+                              _addresses(family, dst), dport,
+                              TCP_STATES.get(state, state) if tcp else state,
+                              '%08X' % wqueue, '%08X' % rqueue,
+                              '%02X' % timer,
+                              '%08X' % (expires * CLK_TCK // 1000),
+                              '%08X' % retransmits, owner, 0, inode, ())
+    finally:
+        diag.close()
+
+
+def records(name='tcp', state=None, local_port=None, remote_port=None,
+            uid=None, fallback=True):
+    """Yield a :class:`procfs.processes.net.SocketEntry` per socket of the
+       ``name`` table (``'tcp'``, ``'tcp6'``, ``'udp'`` or ``'udp6'``).
+
+    Filters are the ones of the /proc handlers ``records`` method; states
+    are filtered by the kernel. Slots are sequence numbers, ``tm_when`` is
+    converted to clock ticks, and ``timeout`` and ``extra``, which netlink
+    does not report, are ``0`` and ``()``.
+
+    When netlink is not permitted or not supported, /proc/self/net/<name>
+    is parsed instead, unless ``fallback`` is false.
+    """
+    if name not in PROTOCOLS:
+        raise ValueError('unknown socket table: %s' % name)
+    family, protocol = PROTOCOLS[name]
+    states = predicate_tokens(state, state_token)
+    if states is None:
+        mask = ALL_STATES
+    else:
+        mask = 0
+        for code in states:
+            mask |= 1 << int(code, 16)
+    try:
+        diag = SockDiag()
+        try:
+            messages = diag.dump(family, protocol, mask)
+        except Exception:
+            diag.close()
+            raise
+    except EnvironmentError:
+        if not fallback:
+            raise
+        return getattr(net, name)('self').records(state, local_port,
+                                                  remote_port, uid)
+    return _entries(diag, messages, protocol == socket.IPPROTO_TCP,
+                    local_port, remote_port, uid)
@@ -0,0 +1,84 @@
+"""Parallel process scanning
+
+Work on process IDs is split into chunks of ``chunksize`` pids and each
+chunk is handed to an executor as a single task, whose result is a plain
+list of tuples so that it is cheap to pickle. Any object providing a
+``map(function, iterable, chunksize=...)`` method can be used as an
+executor: :mod:`multiprocessing` pools as well as
+:mod:`concurrent.futures` executors.
+
+A thread pool fits I/O-bound reads of small files (``stat``, ``status``),
+a process pool fits parse-heavy files (``smaps``). With a process pool,
+functions must be defined at module level so that they can be pickled.
+
+Results are always returned in the order of the input pids.
+"""
+
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from procfs.exceptions import ProcessException, PathNotFoundError
+
+
+DEFAULT_CHUNKSIZE = 256
+
+
+def thread_pool(workers=None):
+    """Return a pool of ``workers`` threads (one per CPU by default)"""
+    return ThreadPool(workers)
+
+
+def process_pool(workers=None):
+    """Return a pool of ``workers`` processes (one per CPU by default)"""
+    return Pool(workers)
+
+
+def chunks(items, size):
+    """Split ``items`` in lists of ``size`` items"""
+    items = list(items)
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+def _call(task):
+    function, chunk, args = task
+    return function(chunk, *args)
+
+
+def map_chunks(function, items, executor=None,
+               chunksize=DEFAULT_CHUNKSIZE, args=()):
+    """Call ``function(chunk, *args)`` for each chunk of ``items``.
+
+    Chunks are processed by ``executor``, or sequentially if it is
+    ``None``. The lists returned by each call are concatenated.
+    """
+    tasks = [(function, chunk, tuple(args))
+             for chunk in chunks(items, chunksize)]
+    if executor is None:
+        results = [_call(task) for task in tasks]
+    else:
+        results = executor.map(_call, tasks, chunksize=1)
+    merged = []
+    for result in results:
+        merged.extend(result)
+    return merged
+
+
+def _map_pids(pids, function, args):
+    results = []
+    for pid in pids:
+        try:
+            results.append((pid, function(pid, *args)))
+        except (IOError, OSError, PathNotFoundError, ProcessException):
+            # The process exited
+            pass
+    return results
+
+
+def map_processes(function, pids, executor=None,
+                  chunksize=DEFAULT_CHUNKSIZE, args=()):
+    """Return ``(pid, function(pid, *args))`` for each of ``pids``.
+
+    Processes that exit while being read are left out.
+    """
+    return map_chunks(_map_pids, pids, executor, chunksize,
+                      (function, tuple(args)))
@@ -0,0 +1,237 @@
+"""Persistent /proc file descriptors"""
+
+import errno
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from procfs.exceptions import PathNotFoundError, ProcessGoneError
+
+# Whether files can be opened, stat'ed and links read relative to a
+# directory descriptor
+_DIR_FD = all(function in getattr(os, 'supports_dir_fd', ())
+              for function in (os.open, os.stat, os.readlink))
+
+
+class FilePool(object):
+    """Keep /proc files open and re-read them from offset 0.
+
+    Instead of an ``open()``, ``read()``, ``close()`` sequence per sample,
+    a pooled file is opened once and then read with a single ``pread()``
+    into a reusable buffer (``lseek()`` and ``read()`` on Python versions
+    without ``os.pread``).
+
+    At most ``size`` descriptors are kept open, the least recently used
+    one being closed first. The buffer grows to fit the largest file read.
+    seq_file-backed files return about a page per read, so a file is read
+    until a read returns no data.
+    """
+
+    def __init__(self, size=16, bufsize=16384):
+        if size < 1:
+            raise ValueError('pool size must be positive')
+        self._size = size
+        self._buffer = bytearray(bufsize)
+        self._fds = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, path):
+        """Read the whole content of ``path``"""
+        with self._lock:
+            fd = self._fds.pop(path, None)
+            if fd is None:
+                fd = os.open(path, os.O_RDONLY)
+                while len(self._fds) >= self._size:
+                    os.close(self._fds.popitem(last=False)[1])
+            try:
+                data = self._read_fd(fd)
+            except (IOError, OSError):
+                os.close(fd)
+                raise
+            self._fds[path] = fd
+        if not isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        return data
+
+    def _read_fd(self, fd):
+        size = 0
+        while True:
+            if hasattr(os, 'preadv'):
+                view = memoryview(self._buffer)
+                try:
+                    count = os.preadv(fd, [view[size:]], size)
+                finally:
+                    view.release()
+            elif hasattr(os, 'pread'):
+                chunk = os.pread(fd, len(self._buffer) - size, size)
+                count = len(chunk)
+                self._buffer[size:size + count] = chunk
+            else:
+                if not size:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                chunk = os.read(fd, len(self._buffer) - size)
+                count = len(chunk)
+                self._buffer[size:size + count] = chunk
+            if not count:
+                return bytes(self._buffer[:size])
+            size += count
+            if size == len(self._buffer):
+                self._buffer.extend(bytearray(len(self._buffer)))
+
+    def __contains__(self, path):
+        return path in self._fds
+
+    def __len__(self):
+        return len(self._fds)
+
+    def close(self):
+        """Close every pooled descriptor"""
+        with self._lock:
+            while self._fds:
+                os.close(self._fds.popitem()[1])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return '<FilePool: %d/%d>' % (len(self), self._size)
+
+
+class PinnedDirectory(object):
+    """Read the files of a /proc/<pid> directory through a descriptor of
+       the directory.
+
+    Files are opened relative to the directory, with ``openat()`` (or its
+    /proc/self/fd/<fd> path on Python versions without ``dir_fd``), which
+    skips the resolution of the /proc/<pid> part of their path. The
+    descriptor keeps referring to the process it was opened for: once it
+    exited, reads raise :class:`procfs.exceptions.ProcessGoneError`, even
+    if its pid was reused.
+
+    ``path`` is the directory and ``pid`` the ID of its process. Raises
+    :class:`OSError` when the directory cannot be opened.
+    """
+
+    def __init__(self, path, pid):
+        self.path = path.rstrip('/')
+        self.pid = pid
+        self._prefix = self.path + '/'
+        self._fd = os.open(self.path,
+                           os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+
+    def _name(self, path):
+        """The path of ``path`` relative to the directory"""
+        if path.startswith(self._prefix):
+            return path[len(self._prefix):]
+        return path
+
+    def _open(self, name):
+        if _DIR_FD:
+            return os.open(name, os.O_RDONLY, dir_fd=self._fd)
+        return os.open('/proc/self/fd/%d/%s' % (self._fd, name), os.O_RDONLY)
+
+    def _lstat(self, name):
+        if _DIR_FD:
+            return os.stat(name, dir_fd=self._fd, follow_symlinks=False)
+        return os.lstat('/proc/self/fd/%d/%s' % (self._fd, name))
+
+    def _stat(self, name):
+        if _DIR_FD:
+            return os.stat(name, dir_fd=self._fd)
+        return os.stat('/proc/self/fd/%d/%s' % (self._fd, name))
+
+    def _readlink(self, name):
+        if _DIR_FD:
+            return os.readlink(name, dir_fd=self._fd)
+        return os.readlink('/proc/self/fd/%d/%s' % (self._fd, name))
+
+    def _gone(self, error):
+        """Whether ``error`` comes from the exit of the process: files of
+           an exited process are not found, and its own stat file neither
+        """
+        if error.errno == errno.ESRCH:
+            return True
+        return error.errno == errno.ENOENT and not self.alive()
+
+    def alive(self):
+        """Whether the process still exists"""
+        try:
+            self._lstat('stat')
+        except OSError:
+            return False
+        return True
+
+    def read(self, path):
+        """Read the whole content of ``path``, absolute or relative to the
+           directory
+        """
+        try:
+            fd = self._open(self._name(path))
+            try:
+                chunks = []
+                while True:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+            finally:
+                os.close(fd)
+        except OSError as error:
+            if self._gone(error):
+                raise ProcessGoneError(self.pid)
+            raise
+        data = b''.join(chunks)
+        if not isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        return data
+
+    def mode(self, path):
+        """Return the file type bits of ``path``, without following links
+        """
+        try:
+            return stat.S_IFMT(self._lstat(self._name(path)).st_mode)
+        except OSError as error:
+            if self._gone(error):
+                raise ProcessGoneError(self.pid)
+            raise PathNotFoundError(path)
+
+    def exists(self, path):
+        """Whether ``path`` exists, following links"""
+        try:
+            self._stat(self._name(path))
+        except OSError as error:
+            if self._gone(error):
+                raise ProcessGoneError(self.pid)
+            return False
+        return True
+
+    def readlink(self, path):
+        """Return the target of the link ``path``"""
+        try:
+            return self._readlink(self._name(path))
+        except OSError as error:
+            if self._gone(error):
+                raise ProcessGoneError(self.pid)
+            raise
+
+    def fileno(self):
+        return self._fd
+
+    def close(self):
+        """Close the directory descriptor"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return '<PinnedDirectory: %s>' % self.path
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 
-from procfs.core import Dict, File
+from procfs.core import Dict, File, CLK_TCK
+from procfs.records import record
 
 
 class cpuinfo(File):
@@ -93,6 +94,9 @@ class stat(File):
     """/proc/stat
     """
 
+    _cpu_keys = ('user', 'nice', 'system', 'idle', 'iowait', 'irq',
+                 'softirq', 'steal', 'guest', 'total')
+
     def _parse(self, content):
         lines = content.splitlines()
         result = Dict(cpu=Dict())
@@ -104,8 +108,6 @@ class stat(File):
             else:
                 other_lines.append(line)
 
-        cpu_keys = ('user', 'nice', 'system', 'idle', 'iowait', 'irq',
-                    'softirq', 'steal', 'guest', 'total')
         for line in cpu_lines:
             str_values = line.split()
             cpu = str_values.pop(0)
@@ -114,10 +116,10 @@ class stat(File):
             for value in str_values:
                 value = int(value)
                 total += value
-                value = timedelta(seconds=value / 100.)
+                value = timedelta(seconds=value / float(CLK_TCK))
                 values.append(value)
-            values.append(timedelta(seconds=total / 100.))
-            result[cpu] = Dict(zip(cpu_keys, values))
+            values.append(timedelta(seconds=total / float(CLK_TCK)))
+            result[cpu] = CpuTimes(*values)
 
         for line in other_lines:
             key, value = line.split(' ', 1)
@@ -146,6 +148,9 @@ class stat(File):
         return result
 
 
+CpuTimes = record('CpuTimes', stat._cpu_keys)
+
+
 class loadavg(File):
     """/proc/loadavg
     """
@@ -239,12 +244,19 @@ class meminfo(File):
 
 class diskstats(File):
     """/proc/diskstats
+
+    discard (Linux 4.18+) and flush (Linux 5.5+) counters are only present
+    when the kernel reports them.
     """
 
-    __keys = ('read__completed', 'read__merged', 'read__sectors',
-              'read__milliseconds', 'write__completed', 'write__merged',
-              'write__sectors', 'write__milliseconds', 'io__in_progress',
-              'io__milliseconds', 'io__weighted_milliseconds')
+    KEYS = ('read__completed', 'read__merged', 'read__sectors',
+            'read__milliseconds', 'write__completed', 'write__merged',
+            'write__sectors', 'write__milliseconds', 'io__in_progress',
+            'io__milliseconds', 'io__weighted_milliseconds',
+            'discard__completed', 'discard__merged', 'discard__sectors',
+            'discard__milliseconds', 'flush__completed',
+            'flush__milliseconds')
+    __keys = [tuple(key.split('__', 1)) for key in KEYS]
 
     def _parse(self, content):
         lines = content.splitlines()
@@ -254,10 +266,11 @@ class diskstats(File):
             major, minor, device = values[:3]
             major, minor = int(major), int(minor)
             values = map(int, values[3:])
-            result[device] = Dict(read=Dict(), write=Dict(), io=Dict())
-            for index, value in enumerate(values):
-                key1, key2 = self.__keys[index].split('__', 1)
-                result[device][key1][key2] = value
+            data = result[device] = Dict(read=Dict(), write=Dict(), io=Dict())
+            for (key1, key2), value in zip(self.__keys, values):
+                if key1 not in data:
+                    data[key1] = Dict()
+                data[key1][key2] = value
         return result
 
 
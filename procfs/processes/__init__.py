@@ -1,9 +1,18 @@
 """/proc/<pid> handlers"""
 
+import os
 import re
+from collections import namedtuple
 from datetime import timedelta
+from itertools import compress
 
 from procfs.core import ProcessFile, Dict
+from procfs.records import UNSET, intern_string, record
+
+try:
+    intern
+except NameError:
+    from sys import intern
 
 
 class io(ProcessFile):
@@ -65,55 +74,175 @@ class environ(ProcessFile):
         return Dict(env)
 
 
+def split_stat(data):
+    """Split /proc/<pid>/stat content into ``(pid, comm, fields)``.
+
+    ``comm`` may contain spaces and parentheses, so it is delimited by the
+    first opening and the last closing parentheses.
+    """
+    start = data.find('(')
+    end = data.rfind(')')
+    return data[:start].strip(), data[start + 1:end], data[end + 2:].split()
+
+
+def status_field(data, name):
+    """Return the raw value of the ``name`` line of /proc/<pid>/status
+    """
+    prefix = name + ':\t'
+    if data.startswith(prefix):
+        start = len(prefix)
+    else:
+        start = data.find('\n' + prefix)
+        if start == -1:
+            raise KeyError(name)
+        start += len(prefix) + 1
+    end = data.find('\n', start)
+    return data[start:end] if end != -1 else data[start:]
+
+
 class status(ProcessFile):
     """/proc/<pid>/status
+
+    Accessing a single field (``status.Uid``) only parses its line.
     """
 
+    # Lines of recent kernels, others are kept too
+    _fields = """Name Umask State Tgid Ngid Pid PPid TracerPid Uid Gid FDSize
+        Groups NStgid NSpid NSpgid NSsid Kthread VmPeak VmSize VmLck VmPin
+        VmHWM VmRSS RssAnon RssFile RssShmem VmData VmStk VmExe VmLib VmPTE
+        VmSwap HugetlbPages CoreDumping THP_enabled untag_mask Threads SigQ
+        SigPnd ShdPnd SigBlk SigIgn SigCgt CapInh CapPrm CapEff CapBnd
+        CapAmb NoNewPrivs Seccomp Seccomp_filters Speculation_Store_Bypass
+        SpeculationIndirectBranch Cpus_allowed Cpus_allowed_list
+        Mems_allowed Mems_allowed_list voluntary_ctxt_switches
+        nonvoluntary_ctxt_switches""".split()
+
     def _parse(self, content):
-        data = Dict()
+        indexes = self._indexes
+        parsers = self._field_parsers
+        values = [UNSET] * len(indexes)
+        extra = {}
         for line in content.splitlines():
             name, value = line.split(':\t')
-            value = value.strip()
-            if name.startswith('Vm'):
-                value = int(value.split(' kB')[0])
-            elif name in ('Uid', 'Gid'):
-                keys = ('real', 'effective', 'saved_set', 'fs')
-                values = map(int, value.split())
-                value = Dict(zip(keys, values))
-            elif name == 'SigQ':
-                queued, max_ = value.split('/', 1)
-                value = Dict(queued=int(queued), max=int(max_))
-            elif name == 'Groups':
-                groups = value.split()
-                value = map(int, groups)
-            elif name in ('Tgid', 'PPid', 'TracerPid', 'FDSize', 'Threads',
-                          'Pid', 'nonvoluntary_ctxt_switches',
-                          'voluntary_ctxt_switches'):
-                value = int(value)
-            data[name] = value
-        return data
+            index = indexes.get(name)
+            if index is None:
+                extra[name] = self._parse_value(name, value)
+            else:
+                values[index] = parsers[index](value.strip())
+        return ProcStatus(*values, **extra)
+
+    def _parse_field(self, content, name):
+        return self._parse_value(name, status_field(content, name))
+
+    def _parse_value(self, name, value):
+        index = self._indexes.get(name)
+        if index is None:
+            parser = _status_parser(name)
+        else:
+            parser = self._field_parsers[index]
+        return parser(value.strip())
+
+
+def _kilobytes(value):
+    return int(value.split(' kB')[0])
+
+
+def _status_ids(value):
+    return StatusIds(*map(int, value.split()))
+
+
+def _signal_queue(value):
+    queued, max_ = value.split('/', 1)
+    return SignalQueue(int(queued), int(max_))
+
+
+def _groups(value):
+    return map(int, value.split())
+
+
+def _status_parser(name):
+    """The parser of the value of a /proc/<pid>/status line"""
+    if name.startswith('Vm'):
+        return _kilobytes
+    elif name in ('Uid', 'Gid'):
+        return _status_ids
+    elif name == 'SigQ':
+        return _signal_queue
+    elif name == 'Groups':
+        return _groups
+    elif name in ('Tgid', 'PPid', 'TracerPid', 'FDSize', 'Threads', 'Pid',
+                  'nonvoluntary_ctxt_switches', 'voluntary_ctxt_switches'):
+        return int
+    # Names, states and masks are the same in many processes
+    return intern
+
+
+status._indexes = dict((name, index)
+                       for index, name in enumerate(status._fields))
+status._field_parsers = [_status_parser(name) for name in status._fields]
+ProcStatus = record('ProcStatus', status._fields, extensible=True)
+StatusIds = record('StatusIds', ('real', 'effective', 'saved_set', 'fs'))
+SignalQueue = record('SignalQueue', ('queued', 'max'))
 
 
 class stat(ProcessFile):
     """/proc/<pid>/stat
+
+    Accessing a single field (``stat.ppid``) only splits the content up
+    to that field.
     """
 
-    def _parse(self, data):
-        header = """pid tcomm state ppid pgrp sid tty_nr tty_pgrp
+    _header = """pid tcomm state ppid pgrp sid tty_nr tty_pgrp
         flags min_flt cmin_flt maj_flt cmaj_flt utime stime cutime
         cstime priority nice num_threads _ start_time vsize rss
         rsslim start_code end_code start_stack esp eip pending
         blocked sigign sigcatch wchan _ _ exit_signal task_cpu
-        rt_priority policy blkio_ticks gtime cgtime"""
-        header = header.split()
-        data = Dict(zip(header, data.split()))
-        del data['_']
-        for key, value in data.items():
-            if key.endswith('time'):
-                data[key] = timedelta(seconds=int(value))
-            elif key not in ('state', 'tcomm'):
-                data[key] = int(value)
-        return data
+        rt_priority policy blkio_ticks gtime cgtime""".split()
+    _indexes = dict((key, index) for index, key in enumerate(_header)
+                    if key != '_')
+
+    def _parse(self, data):
+        pid, comm, values = split_stat(data)
+        values = [pid, '(%s)' % comm] + values
+        return ProcStat(*[parse(value) for parse, value in zip(
+            self._parsers, compress(values, self._kept))])
+
+    def _parse_field(self, data, name):
+        index = self._indexes[name]
+        if index == 0:
+            value = data.split(None, 1)[0]
+        elif index == 1:
+            value = '(%s)' % data[data.find('(') + 1:data.rfind(')')]
+        else:
+            values = data[data.rfind(')') + 2:].split(None, index - 1)
+            if len(values) < index - 1:
+                raise KeyError(name)
+            value = values[index - 2]
+        return self._parse_value(name, value)
+
+    def _parse_value(self, key, value):
+        return _stat_parser(key)(value)
+
+
+def _ticks(value):
+    return timedelta(seconds=int(value))
+
+
+def _stat_parser(key):
+    """The parser of a /proc/<pid>/stat field"""
+    if key.endswith('time'):
+        return _ticks
+    elif key not in ('state', 'tcomm'):
+        return int
+    return intern_string
+
+
+# Whether each field is kept, and the parsers of the kept ones
+stat._kept = [key != '_' for key in stat._header]
+stat._parsers = [_stat_parser(key) for key in stat._header if key != '_']
+
+
+ProcStat = record('ProcStat', (key for key in stat._header if key != '_'))
 
 
 class statm(ProcessFile):
@@ -129,15 +258,91 @@ class statm(ProcessFile):
         return data
 
 
+# Fields summed by smaps.aggregate() by default
+SMAPS_FIELDS = ('Rss', 'Pss', 'Swap', 'Private_Dirty')
+
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+# Sizes that do not add up across mappings
+_SMAPS_PAGE_SIZES = ('KernelPageSize', 'MMUPageSize')
+
+
+def mapping_type(pathname):
+    """The type of a memory mapping, from its smaps pathname: ``'file'``,
+       ``'anonymous'``, ``'shared'`` (System V or POSIX shared memory and
+       shared anonymous mappings), or the name of a special mapping such
+       as ``'heap'``, ``'stack'`` or ``'vdso'``
+    """
+    if not pathname:
+        return 'anonymous'
+    if pathname[0] == '[':
+        name = pathname[1:-1].split(':', 1)[0]
+        return 'anonymous' if name == 'anon' else name
+    if pathname.startswith(('/dev/zero', '/SYSV', '/dev/shm/', '/memfd:')):
+        return 'shared'
+    return 'file'
+
+
+def _smaps_mapping(line):
+    """Split a smaps mapping line into its pathname and other columns"""
+    parts = line.split(None, 5)
+    pathname = parts[5].strip() if len(parts) > 5 else ''
+    return parts[:5], pathname
+
+
+def _smaps_value(value):
+    """Parse a smaps field value, in kB for sizes"""
+    return int(value.split(None, 1)[0])
+
+
+def sum_smaps(lines, key, fields):
+    """Sum ``fields`` (all the sizes if ``None``) of the mappings of smaps
+       ``lines`` by ``key(pathname)``, without storing mappings.
+
+    Returns a :class:`procfs.core.Dict` of totals by key.
+    """
+    result = Dict()
+    wanted = None if fields is None else frozenset(fields)
+    totals = None
+    for line in lines:
+        if not line:
+            continue
+        if line[0] in _HEX_DIGITS:
+            group = key(_smaps_mapping(line)[1])
+            totals = result.get(group)
+            if totals is None:
+                totals = result[group] = Dict.fromkeys(fields or (), 0)
+            continue
+        name, _, value = line.partition(':')
+        if wanted is None:
+            if not value.endswith('kB') or name in _SMAPS_PAGE_SIZES:
+                continue
+        elif name not in wanted:
+            continue
+        totals[name] = totals.get(name, 0) + _smaps_value(value)
+    return result
+
+
+# One memory mapping of /proc/<pid>/smaps. ``fields`` maps field names to
+# their value, in kB for sizes.
+Mapping = namedtuple('Mapping', ('start', 'end', 'perms', 'offset',
+                                 'device', 'inode', 'pathname', 'fields'))
+
+
 class smaps(ProcessFile):
     """/proc/<pid>/smaps
+
+    The dict interface only holds the heap, stack, vdso and vsyscall
+    mappings. :meth:`mappings` streams all the mappings, :meth:`aggregate`
+    sums their fields by pathname or type, and :meth:`totals` sums them
+    all, from /proc/<pid>/smaps_rollup when the kernel provides it.
     """
 
     __re_section = re.compile(r'^(?P<start>[0-9a-f]+)\-(?P<end>[0-9a-f]+) '
                               r'(?P<perms>[r\-][w\-][x\-][sp]) '
-                              r'(?P<offset>[0-9a-f]{8}) '
-                              r'(?P<device>[0-9a-f]{2}:[0-9a-f]{2}) '
-                              r'(?P<inode>\d+)\s+(?P<pathname>.*)')
+                              r'(?P<offset>[0-9a-f]+) '
+                              r'(?P<device>[0-9a-f]+:[0-9a-f]+) '
+                              r'(?P<inode>\d+)\s*(?P<pathname>.*)')
 
     def _parse(self, data):
         result = Dict()
@@ -146,7 +351,7 @@ class smaps(ProcessFile):
             match = self.__re_section.match(line)
             if match:
                 data = match.groupdict()
-                pathname = data.pop('pathname')
+                pathname = data.pop('pathname').strip()
                 if pathname:
                     if pathname[1:-1] in ('heap', 'stack', 'vdso', 'vsyscall'):
                         pathname = pathname[1:-1]
@@ -163,6 +368,91 @@ class smaps(ProcessFile):
                     capture_values = False
             elif capture_values:
                 key, value = line.split(':', 1)
-                value = int(value.split(' kB', 1)[0].strip())
-                result[pathname][key] = value
+                if key == 'VmFlags':
+                    result[pathname][key] = value.split()
+                else:
+                    result[pathname][key] = _smaps_value(value)
         return result
+
+    def _mapping(self, line, fields):
+        (addresses, perms, offset, device, inode), pathname = \
+            _smaps_mapping(line)
+        start, end = addresses.split('-', 1)
+        dev_major, dev_minor = device.split(':', 1)
+        return Mapping(int(start, 16), int(end, 16), perms, int(offset, 16),
+                       Dict(major=int(dev_major, 16),
+                            minor=int(dev_minor, 16)),
+                       int(inode), pathname, fields)
+
+    def mappings(self):
+        """Yield a :class:`Mapping` per memory mapping, reading the file by
+           chunks
+        """
+        line = None
+        fields = None
+        for next_line in self._iterlines():
+            if not next_line:
+                continue
+            if next_line[0] in _HEX_DIGITS:
+                if line is not None:
+                    yield self._mapping(line, fields)
+                line = next_line
+                fields = Dict()
+                continue
+            name, _, value = next_line.partition(':')
+            if name == 'VmFlags':
+                fields[name] = value.split()
+            else:
+                fields[name] = _smaps_value(value)
+        if line is not None:
+            yield self._mapping(line, fields)
+
+    def aggregate(self, by='pathname', fields=SMAPS_FIELDS):
+        """Sum ``fields`` of the mappings by ``'pathname'`` or ``'type'``
+           (see :func:`mapping_type`).
+
+        Returns a :class:`procfs.core.Dict` of totals per pathname (empty
+        for anonymous mappings) or type. All the sizes are summed when
+        ``fields`` is ``None``.
+        """
+        if by == 'pathname':
+            def key(pathname):
+                return pathname
+        elif by == 'type':
+            key = mapping_type
+        else:
+            raise ValueError('cannot aggregate by %r' % by)
+        return sum_smaps(self._iterlines(), key, fields)
+
+    def totals(self, fields=None):
+        """Sum ``fields`` (all the sizes if ``None``) of all the mappings.
+
+        /proc/<pid>/smaps_rollup, which the kernel sums itself, is read
+        when it exists and has all the ``fields``; it lacks the fields
+        that do not add up, such as ``Size``.
+        """
+        rollup_path = self._filepath + '_rollup'
+        if self._pool is not None:
+            # The rollup of a pinned process, not of a process reusing its
+            # pid
+            exists = self._pool.exists(rollup_path)
+        else:
+            exists = os.path.exists(rollup_path)
+        if exists:
+            rollup = smaps_rollup(self._id, check=False, pool=self._pool)()
+            if fields is None:
+                return rollup
+            if all(field in rollup for field in fields):
+                return Dict((field, rollup[field]) for field in fields)
+        totals = sum_smaps(self._iterlines(), lambda pathname: None,
+                           fields)
+        return totals.get(None, Dict.fromkeys(fields or (), 0))
+
+
+class smaps_rollup(ProcessFile):
+    """/proc/<pid>/smaps_rollup
+    """
+
+    def _parse(self, data):
+        return sum_smaps(data.splitlines(), lambda pathname: None,
+                         None).get(None, Dict())
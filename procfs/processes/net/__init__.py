@@ -1,6 +1,26 @@
 """/proc/<pid>/net handlers"""
 
-from procfs.core import ProcessFile, Dict
+import socket
+import struct
+from collections import namedtuple
+
+try:
+    import ipaddress
+except ImportError:
+    ipaddress = None
+
+from procfs import core
+from procfs.core import ProcessDirectory, ProcessFile, Dict, list_pids
+from procfs.exceptions import PathNotFoundError
+from procfs.processes import split_stat
+from procfs.records import intern_string, record
+from procfs.sockets import socket_fds
+from procfs.utils import BoundedCache
+
+try:
+    basestring
+except NameError:
+    basestring = str
 
 
 class dev(ProcessFile):
@@ -81,91 +101,233 @@ class netstat(_BaseStats):
     """
 
 
+# From Linux kernel source: include/net/tcp_states.h
+TCP_STATES = {'01': 'ESTABLISHED',
+              '02': 'SYN_SENT',
+              '03': 'SYN_RECV',
+              '04': 'FIN_WAIT1',
+              '05': 'FIN_WAIT2',
+              '06': 'TIME_WAIT',
+              '07': 'CLOSE',
+              '08': 'CLOSE_WAIT',
+              '09': 'LAST_ACK',
+              '0A': 'LISTEN',
+              '0B': 'CLOSING'}
+TCP_STATE_CODES = dict((name, code) for code, name in TCP_STATES.items())
+
+
+def predicate_tokens(values, format):
+    """Format the value or values of a predicate with ``format``, as the
+       tokens to compare with the columns of socket tables, or ``None``
+       if ``values`` is ``None``
+    """
+    if values is None:
+        return None
+    if isinstance(values, (int, basestring)):
+        values = (values,)
+    return frozenset(format(value) for value in values)
+
+
+def state_token(state):
+    """The kernel code of a TCP state name, or the code itself"""
+    return TCP_STATE_CODES.get(state, state)
+
+
+def _port_token(port):
+    return '%04X' % port
+
+
+class AddressDecoder(object):
+    """Decode the hex addresses of socket tables.
+
+    The kernel prints IPv4 and IPv6 addresses as 32-bit words in host byte
+    order. Decoded addresses are kept in a
+    :class:`procfs.utils.BoundedCache` of ``maxsize`` entries, as the same
+    few addresses appear in most rows.
+    """
+
+    def __init__(self, maxsize=256):
+        self._cache = BoundedCache(maxsize)
+
+    def packed(self, hex_addr):
+        """Return the address in network byte order"""
+        words = [int(hex_addr[index:index + 8], 16)
+                 for index in range(0, len(hex_addr), 8)]
+        return struct.pack('=%dI' % len(words), *words)
+
+    def __call__(self, hex_addr):
+        """Return the address as text, such as ``'127.0.0.1'`` or
+           ``'::1'``
+        """
+        text = self._cache.get(hex_addr)
+        if text is None:
+            packed = self.packed(hex_addr)
+            family = socket.AF_INET if len(packed) == 4 else socket.AF_INET6
+            text = socket.inet_ntop(family, packed)
+            self._cache[hex_addr] = text
+        return text
+
+    def ip(self, hex_addr):
+        """Return the address as an :mod:`ipaddress` object"""
+        if ipaddress is None:
+            raise ImportError('the ipaddress module is not available')
+        # ipaddress wants unicode text on Python 2
+        return ipaddress.ip_address(
+            self(hex_addr).encode('ascii').decode('ascii'))
+
+
+# Shared by all socket table handlers
+decode_address = AddressDecoder()
+
+
+# One socket of /proc/<pid>/net/{tcp,udp,raw}[6]. ``extra`` holds the columns
+# following ``inode``.
+SocketEntry = record('SocketEntry', (
+    'slot', 'local_address', 'local_port', 'remote_address', 'remote_port',
+    'st', 'tx_queue', 'rx_queue', 'tr', 'tm_when', 'retrnsmt', 'uid',
+    'timeout', 'inode', 'extra'))
+
+
 class _TcpUdpBase(ProcessFile):
-    """Helpers for parsing /proc/<pid>/net/tcp and /proc/<pid>/net/udp
+    """Helpers for parsing /proc/<pid>/net/{tcp,udp,raw}[6]
+
+    :meth:`records` streams the socket table, which can be huge, while
+    the dict interface builds it at once, keyed by slot.
     """
 
+    # Dict keys, from the file header
+    _keys = ('local_address', 'rem_address', 'st', 'tx_queue', 'rx_queue',
+             'tr', 'tm->when', 'retrnsmt', 'uid', 'timeout', 'inode')
+
+    _decode_address = decode_address
+
     def _parse_addr(self, addr):
-        hex_addr, hex_port = addr.split(':', 1)
-        ipaddr = '.'.join(map(lambda x: str(int(x, 16)),
-                              (addr[6:8], addr[4:6], addr[2:4], addr[:2])))
-        port = int(hex_port, 16)
-        return ipaddr, port
+        hex_addr, hex_port = addr.rsplit(':', 1)
+        return self._decode_address(hex_addr), int(hex_port, 16)
 
+    def _parse_state(self, st):
+        return intern_string(st)
 
-class tcp(_TcpUdpBase):
-    """/proc/<pid>/net/tcp
-    """
+    def _record_values(self, parts):
+        """The :class:`SocketEntry` values of the tokens of a row"""
+        (slot, local_address, rem_address, st, tx_rx_queue, tr_tm_when,
+         retrnsmt, uid, timeout, inode) = parts[:10]
+        local_addr, local_port = self._parse_addr(local_address)
+        remote_addr, remote_port = self._parse_addr(rem_address)
+        tx_queue, rx_queue = tx_rx_queue.split(':', 1)
+        tr, tm_when = tr_tm_when.split(':', 1)
+        return (int(slot.split(':', 1)[0]), local_addr, local_port,
+                remote_addr, remote_port, self._parse_state(st), tx_queue,
+                rx_queue, tr, tm_when, retrnsmt, int(uid), int(timeout),
+                int(inode), tuple(parts[10:]))
 
-    # From Linux kernel source: include/net/tcp_states.h
-    __tcp_states = {'01': 'ESTABLISHED',
-                    '02': 'SYN_SENT',
-                    '03': 'SYN_RECV',
-                    '04': 'FIN_WAIT1',
-                    '05': 'FIN_WAIT2',
-                    '06': 'TIME_WAIT',
-                    '07': 'CLOSE',
-                    '08': 'CLOSE_WAIT',
-                    '09': 'LAST_ACK',
-                    '0A': 'LISTEN',
-                    '0B': 'CLOSING'}
+    def _parse_record(self, parts):
+        return SocketEntry(*self._record_values(parts))
 
-    def _parse(self, data):
-        lines = data.splitlines()
-        header = lines.pop(0).split()
-        header.pop(0)  # skip "sl"
-        header.append('other')
-        result = {}
+    def _parse_records(self, lines, state=None, local_port=None,
+                       remote_port=None, uid=None, parse=None):
+        if parse is None:
+            parse = self._parse_record
+        states = predicate_tokens(state, state_token)
+        local_ports = predicate_tokens(local_port, _port_token)
+        remote_ports = predicate_tokens(remote_port, _port_token)
+        uids = predicate_tokens(uid, str)
+        next(lines, None)  # skip header
         for line in lines:
             parts = line.split()
-            (slot, local_address, rem_address, st, tx_rx_queue, tr_tm_when,
-             retrnsmt, uid, timeout, inode) = parts[:10]
-            local_addr, local_port = self._parse_addr(local_address)
-            remote_addr, remote_port = self._parse_addr(rem_address)
-            other = parts[10:]
-            slot = int(slot.split(':', 1)[0])
-            st = self.__tcp_states[st]
-            tx_queue, rx_queue = tx_rx_queue.split(':', 1)
-            tr, tm_when = tr_tm_when.split(':', 1)
-            uid = int(uid)
-            timeout = int(timeout)
-            inode = int(inode)
-            result[slot] = Dict(zip(header, ((local_addr, local_port),
-                                             (remote_addr, remote_port),
-                                             st, tx_queue, rx_queue, tr,
-                                             tm_when, retrnsmt, uid, timeout,
-                                             inode, other)))
+            if not parts:
+                continue
+            # Reject rows from their raw tokens before decoding anything
+            if states is not None and parts[3] not in states:
+                continue
+            if local_ports is not None and parts[1][-4:] not in local_ports:
+                continue
+            if remote_ports is not None and \
+               parts[2][-4:] not in remote_ports:
+                continue
+            if uids is not None and parts[7] not in uids:
+                continue
+            yield parse(parts)
+
+    def records(self, state=None, local_port=None, remote_port=None,
+                uid=None):
+        """Yield a :class:`SocketEntry` per socket, reading the file by
+           chunks.
+
+        Sockets can be filtered by ``state`` (a name such as ``'LISTEN'``,
+        or a kernel code such as ``'0A'``), ``local_port``,
+        ``remote_port`` and ``uid``; each accepts a value or a collection
+        of values.
+        """
+        return self._parse_records(self._iterlines(), state, local_port,
+                                   remote_port, uid)
+
+    def _row_values(self, values):
+        """The dict interface values of :class:`SocketEntry` values"""
+        return ((values[1], values[2]), (values[3], values[4])) + \
+            values[5:14]
+
+    def _parse(self, data):
+        result = {}
+        row = self._row
+        for values in self._parse_records(iter(data.splitlines()),
+                                          parse=self._record_values):
+            result[values[0]] = row(*self._row_values(values))
         return result
 
 
+class tcp(_TcpUdpBase):
+    """/proc/<pid>/net/tcp
+    """
+
+    _keys = _TcpUdpBase._keys + ('other',)
+
+    def _parse_state(self, st):
+        return TCP_STATES[st]
+
+    def _row_values(self, values):
+        return super(tcp, self)._row_values(values) + (list(values[14]),)
+
+
+# A socket of the tcp and udp dict interfaces, keyed by their header names
+TcpRow = tcp._row = record('TcpRow', tcp._keys)
+
+
 class udp(_TcpUdpBase):
     """/proc/<pid>/net/udp
     """
 
-    def _parse(self, data):
-        lines = data.splitlines()
-        header = lines.pop(0).split()
-        header.pop(0)  # skip "sl"
-        result = {}
-        for line in lines:
-            (slot, local_address, rem_address, st, tx_rx_queue,
-             tr_tm_when, retrnsmt, uid, timeout, inode, ref,
-             pointer, drops) = line.split()
-            local_addr, local_port = self._parse_addr(local_address)
-            remote_addr, remote_port = self._parse_addr(rem_address)
-            slot = int(slot.split(':', 1)[0])
-            tx_queue, rx_queue = tx_rx_queue.split(':', 1)
-            tr, tm_when = tr_tm_when.split(':', 1)
-            uid = int(uid)
-            timeout = int(timeout)
-            inode = int(inode)
-            result[slot] = Dict(
-                zip(header, ((local_addr, local_port),
-                             (remote_addr, remote_port),
-                             st, tx_queue, rx_queue, tr, tm_when,
-                             retrnsmt, uid, timeout, inode, ref,
-                             pointer, drops)))
-        return result
+    _keys = _TcpUdpBase._keys + ('ref', 'pointer', 'drops')
+
+    def _row_values(self, values):
+        return super(udp, self)._row_values(values) + values[14][:3]
+
+
+UdpRow = udp._row = record('UdpRow', udp._keys)
+
+
+class tcp6(tcp):
+    """/proc/<pid>/net/tcp6
+    """
+
+
+class udp6(udp):
+    """/proc/<pid>/net/udp6
+    """
+
+
+class raw(udp):
+    """/proc/<pid>/net/raw
+
+    The port is the IP protocol number.
+    """
+
+
+class raw6(udp):
+    """/proc/<pid>/net/raw6
+
+    The port is the IP protocol number.
+    """
 
 
 class sockstat(ProcessFile):
@@ -203,3 +365,59 @@ class dev_mcast(ProcessFile):
                                          gusers=int(gusers),
                                          addresses=[address])
         return result
+
+
+# A listening TCP socket and the first process owning it. ``pid`` and
+# ``comm`` are ``None`` when the owner's file descriptors are not readable.
+Listener = namedtuple('Listener', ('port', 'address', 'pid', 'comm'))
+
+
+class NetDirectory(ProcessDirectory):
+    """/proc/<pid>/net
+    """
+
+    def listeners(self, port=None):
+        """Return a :class:`Listener` per listening TCP socket, on ``port``
+           (a port or a collection of ports) if given, sorted by port.
+
+        Only the LISTEN rows of the tcp and tcp6 tables are decoded, then
+        fd directories are scanned until the owner of each socket is
+        found, so a socket shared by several processes is reported with
+        the first of them.
+        """
+        sockets = {}
+        for name in ('tcp', 'tcp6'):
+            try:
+                table = getattr(self, name)
+            except PathNotFoundError:
+                # No IPv6
+                continue
+            for entry in table.records(state='LISTEN', local_port=port):
+                sockets[entry.inode] = entry
+        owners = {}
+        pending = set(sockets)
+        for pid in list_pids():
+            if not pending:
+                break
+            try:
+                found = pending.intersection(socket_fds(pid))
+            except OSError:
+                # Exited, or not readable
+                continue
+            if found:
+                try:
+                    _, comm, _ = split_stat(
+                        core.readfile('/proc/%s/stat' % pid))
+                except (IOError, OSError):
+                    continue
+                for inode in found:
+                    owners[inode] = (pid, comm)
+                pending -= found
+        return sorted((Listener(entry.local_port, entry.local_address,
+                                *owners.get(inode, (None, None)))
+                       for inode, entry in sockets.items()),
+                      key=lambda listener: (listener.port,
+                                            listener.address))
+
+
+_directory = NetDirectory
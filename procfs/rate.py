@@ -0,0 +1,204 @@
+"""Counter deltas and rates for any handler output
+
+Handlers return monotonically increasing counters in nested dicts
+(``proc.vmstat``, ``proc.diskstats``, ``proc.net.dev``, ...). This module
+diffs two such samples without per-handler code:
+
+    >>> rate = Rate()
+    >>> rate.update(proc.net.dev)
+    >>> time.sleep(1)
+    >>> rate.update(proc.net.dev).eth0.receive.bytes
+    1234.5
+
+Numeric leaves are flattened into key paths. As long as the shape of the
+samples does not change, the values of a new sample are read along the
+paths of the first one and diffed against the previous values as two
+flat lists. Keys that appear have no delta until their second
+sample, keys that disappear are dropped.
+
+A counter going backwards either wrapped around (it was in the upper
+half of a 32 or 64-bit range) or was reset, in which case its new value
+is the delta.
+"""
+
+import time
+from datetime import timedelta
+from numbers import Real
+
+from procfs.core import Dict
+from procfs.records import Record
+
+
+def _number(value):
+    """The numeric value of a leaf, or ``None``"""
+    if isinstance(value, timedelta):
+        return value.days * 86400 + value.seconds + value.microseconds / 1e6
+    if isinstance(value, Real) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _walk(data, path=()):
+    """Return the ``(paths, values, layout)`` of numeric leaves of
+       ``data``.
+
+    The layout lists, for each mapping, the index of its parent mapping in
+    the layout (``None`` for ``data``), its key, its size and the keys of
+    its numeric leaves, in the order of ``paths``.
+    """
+    paths = []
+    values = []
+    layout = []
+    stack = [(None, None, path, data)]
+    while stack:
+        parent, name, path, data = stack.pop()
+        index = len(layout)
+        keys = []
+        for key in data:
+            value = data[key]
+            if isinstance(value, (dict, Record)):
+                stack.append((index, key, path + (key,), value))
+                continue
+            value = _number(value)
+            if value is not None:
+                keys.append(key)
+                paths.append(path + (key,))
+                values.append(value)
+        layout.append((parent, name, len(data), tuple(keys)))
+    return tuple(paths), values, tuple(layout)
+
+
+def flatten(data, path=()):
+    """Return the ``(paths, values)`` of numeric leaves of ``data``.
+
+    Timedelta values are converted to seconds.
+    """
+    return _walk(data, path)[:2]
+
+
+def _read(data, layout):
+    """Read the numeric leaves of ``data`` along ``layout`` (see
+       :func:`_walk`), or return ``None`` if its shape changed
+    """
+    mappings = []
+    values = []
+    try:
+        for parent, name, size, keys in layout:
+            if parent is not None:
+                data = mappings[parent][name]
+            if len(data) != size:
+                return None
+            mappings.append(data)
+            for key in keys:
+                value = _number(data[key])
+                if value is None:
+                    return None
+                values.append(value)
+    except (KeyError, TypeError):
+        return None
+    return values
+
+
+def unflatten(paths, values):
+    """Build nested :class:`procfs.core.Dict` from ``paths`` and ``values``
+    """
+    result = Dict()
+    for path, value in zip(paths, values):
+        data = result
+        for key in path[:-1]:
+            if key not in data:
+                data[key] = Dict()
+            data = data[key]
+        data[path[-1]] = value
+    return result
+
+
+class Delta(object):
+    """Differences between successive samples.
+
+    ``wrap`` lists the counter widths, in bits, to consider when a counter
+    goes backwards.
+    """
+
+    def __init__(self, wrap=(32, 64)):
+        self._limits = sorted(2 ** bits for bits in wrap)
+        self._paths = None
+        self._layout = None
+        self._values = None
+        self._timestamp = None
+
+    def _diff(self, old, new):
+        if new >= old:
+            return new - old
+        for limit in self._limits:
+            if limit // 2 <= old < limit:
+                return new + limit - old
+        return new
+
+    def _deltas(self, paths, values):
+        if paths is self._paths or paths == self._paths:
+            return paths, [self._diff(old, new)
+                           for old, new in zip(self._values, values)]
+        previous = dict(zip(self._paths, self._values))
+        kept = []
+        deltas = []
+        for path, new in zip(paths, values):
+            old = previous.get(path)
+            if old is not None:
+                kept.append(path)
+                deltas.append(self._diff(old, new))
+        return tuple(kept), deltas
+
+    def update(self, sample, timestamp=None):
+        """Record ``sample`` and return its differences with the previous
+           one, or ``None`` for the first sample
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if not isinstance(sample, (dict, Record)):
+            sample = sample()
+        values = None
+        if self._layout is not None:
+            values = _read(sample, self._layout)
+        if values is None:
+            paths, values, self._layout = _walk(sample)
+        else:
+            paths = self._paths
+        if self._paths is None:
+            result = None
+        else:
+            result = self._result(*self._deltas(paths, values),
+                                  interval=timestamp - self._timestamp)
+        self._paths, self._values = paths, values
+        self._timestamp = timestamp
+        return result
+
+    def _result(self, paths, deltas, interval):
+        return unflatten(paths, deltas)
+
+    def reset(self):
+        """Forget the previous sample"""
+        self._paths = self._layout = self._values = self._timestamp = None
+
+
+class Rate(Delta):
+    """Per-second rates between successive samples"""
+
+    def _result(self, paths, deltas, interval):
+        if interval <= 0:
+            raise ValueError('samples are not in chronological order')
+        return unflatten(paths, [delta / float(interval) for delta in deltas])
+
+
+def delta(old, new, wrap=(32, 64)):
+    """Return the differences between two samples"""
+    engine = Delta(wrap)
+    engine.update(old, 0)
+    return engine.update(new, 0)
+
+
+def rate(old, old_timestamp, new, new_timestamp, wrap=(32, 64)):
+    """Return the per-second rates between two timestamped samples"""
+    engine = Rate(wrap)
+    engine.update(old, old_timestamp)
+    return engine.update(new, new_timestamp)
@@ -0,0 +1,220 @@
+"""Compact records of parsed fields
+
+A :class:`procfs.core.Dict` per parsed file holds a hash table and the
+names of its fields. Files with a known set of fields are parsed into
+records instead, whose values are stored in ``__slots__``:
+
+    >>> ProcStat = record('ProcStat', ('pid', 'tcomm', 'state'))
+    >>> stat = ProcStat(1, '(systemd)', 'S')
+    >>> stat.pid, stat['tcomm']
+    (1, '(systemd)')
+
+Records are built from positional values in the order of their fields,
+which is much faster than setting fields one by one; :data:`UNSET`
+values leave their field unset.
+
+Records can be used like a ``Dict``: their fields are available as
+attributes and items, and they provide the read-only dict methods. Field
+names that are not identifiers (``tm->when``) are stored under an
+attribute name with ``_`` instead of other characters (``tm_when``).
+"""
+
+import re
+import sys
+from collections import OrderedDict
+
+try:
+    intern
+except NameError:
+    from sys import intern
+
+
+# Positional value of a field left unset
+UNSET = object()
+
+
+def attribute_name(key):
+    """The attribute name of a record field"""
+    return re.sub(r'\W+', '_', key)
+
+
+def intern_string(value):
+    """Intern ``value``, repeated across records (``'S (sleeping)'``), if
+       it is a string
+    """
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+class Record(object):
+    """Base class of records, see :func:`record`"""
+
+    __slots__ = ()
+
+    # Field names, in order, their attribute names and the setters of
+    # their slots
+    _keys = ()
+    _attributes = {}
+    _setters = ()
+
+    # Whether fields which are not in ``_keys`` are accepted, in a dict
+    # stored in the ``_extra`` slot
+    _extensible = False
+
+    def __init__(self, *values, **items):
+        for setter, value in zip(self._setters, values):
+            if value is not UNSET:
+                setter(self, value)
+        for key, value in items.items():
+            self[key] = value
+
+    def _get(self, key, default=UNSET):
+        attribute = self._attributes.get(key)
+        if attribute is not None:
+            try:
+                return object.__getattribute__(self, attribute)
+            except AttributeError:
+                pass
+        elif self._extensible:
+            extra = self._extra_fields()
+            if key in extra:
+                return extra[key]
+        if default is UNSET:
+            raise KeyError(key)
+        return default
+
+    def _extra_fields(self):
+        try:
+            return object.__getattribute__(self, '_extra')
+        except AttributeError:
+            return {}
+
+    def __getitem__(self, key):
+        return self._get(key)
+
+    def __setitem__(self, key, value):
+        attribute = self._attributes.get(key)
+        if attribute is not None:
+            object.__setattr__(self, attribute, value)
+        elif self._extensible:
+            extra = self._extra_fields()
+            if not extra:
+                object.__setattr__(self, '_extra', extra)
+            extra[key] = value
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        attribute = self._attributes.get(key)
+        if attribute is not None:
+            object.__delattr__(self, attribute)
+        else:
+            del self._extra[key]
+
+    def __getattr__(self, attr):
+        # Fields that are not identifiers, unset fields and extra fields;
+        # also called explicitly by cli.find()
+        try:
+            return self._get(attr)
+        except KeyError:
+            raise AttributeError(attr)
+
+    def keys(self):
+        keys = [key for key in self._keys if self._get(key, self) is not self]
+        if self._extensible:
+            keys.extend(self._extra_fields())
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def get(self, key, default=None):
+        return self._get(key, default)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return self._get(key, self) is not self
+
+    def _asdict(self):
+        """Return an ``OrderedDict`` of the fields"""
+        return OrderedDict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other._asdict()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.items()
+
+    def __setstate__(self, state):
+        for key, value in state:
+            self[key] = value
+
+    def __reduce__(self):
+        return self.__class__, (), self.__getstate__()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % (self._attributes.get(key, key), value)
+            for key, value in self.items()))
+
+
+def record(name, keys, extensible=False):
+    """Create a :class:`Record` class named ``name`` with the fields
+       ``keys``.
+
+    When ``extensible`` is true, the records also accept fields which are
+    not in ``keys``, such as the lines added to a file by newer kernels.
+    """
+    keys = tuple(keys)
+    attributes = [attribute_name(key) for key in keys]
+    slots = tuple(attributes)
+    if extensible:
+        slots += ('_extra',)
+    namespace = {
+        '__slots__': slots,
+        '_keys': keys,
+        '_attributes': dict(zip(keys, attributes)),
+        '_extensible': extensible,
+    }
+    # Like namedtuple, for pickling
+    try:
+        namespace['__module__'] = sys._getframe(1).f_globals.get(
+            '__name__', '__main__')
+    except (AttributeError, ValueError):
+        pass
+    cls = type(name, (Record,), namespace)
+    cls._setters = tuple(getattr(cls, attribute).__set__
+                         for attribute in attributes)
+    return cls
@@ -0,0 +1,141 @@
+"""Registry of /proc file handlers
+
+Handlers are registered by the path of their file relative to /proc, where
+``<pid>`` stands for any process or thread ID: ``stat`` is /proc/stat,
+``<pid>/status`` is /proc/<pid>/status and ``<pid>/net/tcp`` is
+/proc/<pid>/net/tcp. Patterns can also contain :mod:`fnmatch` wildcards,
+and directories are registered the same way with their directory class.
+
+The handlers of this package are registered when it is imported, and
+other handlers can be added with :func:`register`:
+
+    >>> class wchan(ProcessFile):
+    ...     pass
+    >>> procfs.register('<pid>/wchan', wchan)
+
+File handlers are called with the path of the file: the process ID and
+the path relative to /proc/<pid> for :class:`procfs.core.ProcessFile`
+handlers, the absolute path for :class:`procfs.core.File` ones. Both take
+the ``pool`` of the directory and ``check=False``, as the directory
+already checked that it is a file, in this order after the path.
+"""
+
+import pkgutil
+import re
+import threading
+from fnmatch import fnmatchcase
+
+
+PID = '<pid>'
+
+_WILDCARDS = re.compile(r'[*?[]')
+
+
+class Registry(object):
+    """Map relative /proc path patterns to handler classes.
+
+    Lookups are cached, including the ones of paths without a handler, so
+    that resolving a path is a single dict lookup once it has been seen.
+    """
+
+    def __init__(self):
+        # pattern -> handler, for patterns without wildcards
+        self._handlers = {}
+        # (pattern, handler), most recently registered first
+        self._wildcards = []
+        # path -> handler or None
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def register(self, pattern, handler):
+        """Handle the paths matching ``pattern`` with ``handler``,
+           instead of the handler previously registered for it, if any
+        """
+        if not pattern or pattern.startswith('/'):
+            raise ValueError('patterns are relative to /proc: %r' % pattern)
+        with self._lock:
+            if _WILDCARDS.search(pattern):
+                self._wildcards = [(pattern, handler)] + [
+                    item for item in self._wildcards if item[0] != pattern]
+            else:
+                self._handlers[pattern] = handler
+            self._resolved = {}
+
+    def unregister(self, pattern):
+        """Remove the handler of ``pattern``"""
+        with self._lock:
+            if pattern in self._handlers:
+                del self._handlers[pattern]
+            else:
+                wildcards = [item for item in self._wildcards
+                             if item[0] != pattern]
+                if len(wildcards) == len(self._wildcards):
+                    raise KeyError(pattern)
+                self._wildcards = wildcards
+            self._resolved = {}
+
+    def register_module(self, module, prefix=''):
+        """Register the handler classes of ``module`` under ``prefix``, by
+           their name, and its ``_directory`` class, if any, for the
+           ``prefix`` directory
+        """
+        from procfs.core import BaseFile
+
+        for name, handler in vars(module).items():
+            if name.startswith('_') or not isinstance(handler, type) or \
+               not issubclass(handler, BaseFile) or \
+               handler.__module__ != module.__name__:
+                continue
+            self.register(prefix + name, handler)
+        directory = getattr(module, '_directory', None)
+        if directory is not None:
+            self.register(prefix.rstrip('/'), directory)
+
+    def register_package(self, package, prefix=''):
+        """Register the handlers of ``package`` and of its submodules,
+           each under the directory named after it (``processes.net.rpc``
+           under ``<pid>/net/rpc/``), see :meth:`register_module`
+        """
+        self.register_module(package, prefix)
+        for _, name, _ in pkgutil.iter_modules(getattr(package, '__path__',
+                                                       [])):
+            module = __import__('%s.%s' % (package.__name__, name),
+                                fromlist=[name])
+            self.register_package(module, prefix + name + '/')
+
+    def lookup(self, path):
+        """Return the handler of the relative ``path``, or ``None``"""
+        resolved = self._resolved
+        try:
+            return resolved[path]
+        except KeyError:
+            pass
+        handler = self._handlers.get(path)
+        if handler is None:
+            for pattern, candidate in self._wildcards:
+                if fnmatchcase(path, pattern):
+                    handler = candidate
+                    break
+        resolved[path] = handler
+        return handler
+
+    def __contains__(self, pattern):
+        return pattern in self._handlers or \
+            any(item[0] == pattern for item in self._wildcards)
+
+    def __len__(self):
+        return len(self._handlers) + len(self._wildcards)
+
+    def __repr__(self):
+        return '<Registry: %d handlers>' % len(self)
+
+
+# Handlers of /proc and /proc/<pid> directories
+handlers = Registry()
+
+
+def register(pattern, handler):
+    """Register ``handler`` for ``pattern`` in the default registry, see
+       :meth:`Registry.register`
+    """
+    handlers.register(pattern, handler)
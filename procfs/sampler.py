@@ -0,0 +1,41 @@
+"""Samplers of /proc files
+
+A sampler reads a /proc file on each :meth:`Sampler.sample` call and
+returns what changed since the previous call, such as CPU utilization
+(:class:`procfs.cpu.CpuSampler`) or block device metrics
+(:class:`procfs.disk.DiskSampler`).
+"""
+
+
+class Sampler(object):
+    """Read a /proc file and return what changed since the last read.
+
+    Subclasses set ``_handler``, the handler class of the file,
+    ``_sample``, the class of samples built from its content, and
+    ``_compare``, the function comparing two samples.
+
+    ``pool`` is an optional :class:`procfs.pool.FilePool`, to keep the file
+    open between samples.
+    """
+
+    _handler = None
+    _sample = None
+    _compare = None
+
+    def __init__(self, pool=None):
+        self._file = self._handler(pool=pool)
+        self._last = None
+
+    def read(self):
+        """Return a new sample"""
+        return self._sample(self._file(parse=False))
+
+    def sample(self):
+        """Return the comparison of a new sample with the previous one, or
+           ``None`` on the first call
+        """
+        current = self.read()
+        previous, self._last = self._last, current
+        if previous is None:
+            return None
+        return self._compare(previous, current)
@@ -0,0 +1,148 @@
+"""Bulk, column-oriented /proc/<pid> scanning
+
+:func:`scan` walks /proc once and reads only the files needed by the
+requested fields, without building any :class:`procfs.core.Process`.
+"""
+
+from array import array
+
+from procfs import core
+from procfs.core import Dict, list_pids
+from procfs.parallel import DEFAULT_CHUNKSIZE, map_chunks
+from procfs.processes import split_stat, status_field
+
+
+# /proc/<pid>/stat fields, indexed from the field following ``(comm)``
+STAT_FIELDS = {
+    'state': 0, 'ppid': 1, 'pgrp': 2, 'sid': 3, 'tty_nr': 4,
+    'min_flt': 7, 'maj_flt': 9, 'utime': 11, 'stime': 12,
+    'cutime': 13, 'cstime': 14, 'priority': 15, 'nice': 16,
+    'num_threads': 17, 'start_time': 19, 'vsize': 20, 'rss': 21,
+}
+
+# /proc/<pid>/statm fields
+STATM_FIELDS = {'size': 0, 'resident': 1, 'shared': 2, 'trs': 3, 'drs': 5}
+
+# /proc/<pid>/status fields: (line name, column)
+STATUS_FIELDS = {
+    'uid': ('Uid', 0), 'euid': ('Uid', 1),
+    'gid': ('Gid', 0), 'egid': ('Gid', 1),
+}
+
+# Where each field comes from
+SOURCES = {'pid': None, 'comm': 'stat', 'cmdline': 'cmdline'}
+SOURCES.update((field, 'stat') for field in STAT_FIELDS)
+SOURCES.update((field, 'statm') for field in STATM_FIELDS)
+SOURCES.update((field, 'status') for field in STATUS_FIELDS)
+
+# Fields stored in lists rather than integer arrays
+TEXT_FIELDS = ('comm', 'state', 'cmdline')
+
+DEFAULT_FIELDS = ('pid', 'ppid', 'uid', 'state', 'utime', 'stime', 'rss',
+                  'comm')
+
+
+def _stat_reader(fields):
+    def read(pid, row):
+        _, comm, values = split_stat(core.readfile('/proc/%s/stat' % pid))
+        for field in fields:
+            if field == 'comm':
+                row[field] = comm
+            elif field == 'state':
+                row[field] = values[0]
+            else:
+                row[field] = int(values[STAT_FIELDS[field]])
+    return read
+
+
+def _statm_reader(fields):
+    def read(pid, row):
+        values = core.readfile('/proc/%s/statm' % pid).split()
+        for field in fields:
+            row[field] = int(values[STATM_FIELDS[field]])
+    return read
+
+
+def _status_reader(fields):
+    def read(pid, row):
+        data = core.readfile('/proc/%s/status' % pid)
+        lines = {}
+        for field in fields:
+            name, column = STATUS_FIELDS[field]
+            if name not in lines:
+                lines[name] = status_field(data, name).split()
+            row[field] = int(lines[name][column])
+    return read
+
+
+def _cmdline_reader(fields):
+    def read(pid, row):
+        data = core.readfile('/proc/%s/cmdline' % pid)
+        row['cmdline'] = [arg for arg in data.split('\x00') if arg]
+    return read
+
+
+_READERS = {
+    'stat': _stat_reader,
+    'statm': _statm_reader,
+    'status': _status_reader,
+    'cmdline': _cmdline_reader,
+}
+
+
+def scan_chunk(pids, fields):
+    """Read ``fields`` of ``pids``, and return a row of values per process
+       that could be read, for :func:`procfs.parallel.map_chunks`
+    """
+    by_source = {}
+    for field in fields:
+        source = SOURCES[field]
+        if source is not None:
+            by_source.setdefault(source, []).append(field)
+    readers = [_READERS[source](source_fields)
+               for source, source_fields in sorted(by_source.items())]
+
+    rows = []
+    row = {}
+    for pid in pids:
+        row['pid'] = pid
+        try:
+            for reader in readers:
+                reader(pid, row)
+        except (IOError, OSError):
+            # The process exited
+            continue
+        rows.append(tuple(row[field] for field in fields))
+    return rows
+
+
+def scan(fields=DEFAULT_FIELDS, pids=None, executor=None,
+         chunksize=DEFAULT_CHUNKSIZE):
+    """Scan processes and return their ``fields`` as columns.
+
+    The result is a :class:`procfs.core.Dict` mapping each field to a
+    column: an ``array('l')`` for numeric fields, a list for text fields
+    (``comm``, ``state`` and ``cmdline``). The ``pid`` column is always
+    present, and all columns are ordered by pid.
+
+    ``pids`` restricts the scan to the given process IDs. Processes that
+    exit during the scan are left out. Reads are spread over ``executor``
+    by chunks of ``chunksize`` pids (see :mod:`procfs.parallel`).
+    """
+    fields = list(fields)
+    unknown = [field for field in fields if field not in SOURCES]
+    if unknown:
+        raise ValueError('unknown fields: %s' % ', '.join(unknown))
+    if 'pid' not in fields:
+        fields.insert(0, 'pid')
+    if pids is None:
+        pids = list_pids()
+    else:
+        pids = sorted(int(pid) for pid in pids)
+
+    rows = map_chunks(scan_chunk, pids, executor, chunksize, (fields,))
+    columns = Dict()
+    for index, field in enumerate(fields):
+        values = [row[index] for row in rows]
+        columns[field] = values if field in TEXT_FIELDS else array('l', values)
+    return columns
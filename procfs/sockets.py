@@ -0,0 +1,225 @@
+"""Socket inode to process index
+
+The socket tables of /proc/net give an inode per socket, and the owner of
+a socket is the process having a ``socket:[<inode>]`` link in its
+/proc/<pid>/fd directory. :class:`SocketOwnerIndex` resolves these links
+once per process and keeps them up to date incrementally:
+
+    >>> index = SocketOwnerIndex()
+    >>> for entry in proc.net.tcp.records(state='ESTABLISHED'):
+    ...     print entry.local_port, index.owners(entry.inode)
+"""
+
+import os
+import time
+
+from procfs.core import list_pids, scandir
+
+
+SOCKET_LINK = 'socket:['
+
+
+def _fd_links(path):
+    """Return the ``(fd, link path)`` of a /proc/<pid>/fd directory"""
+    if scandir is not None:
+        return [(entry.name, entry.path) for entry in scandir(path)]
+    return [(name, os.path.join(path, name)) for name in os.listdir(path)]
+
+
+def socket_fds(pid):
+    """Return a dict mapping the socket inodes opened by ``pid`` to their
+       file descriptor.
+
+    Raises :class:`OSError` when the process exited or its file
+    descriptors are not readable.
+    """
+    sockets = {}
+    for fd, link in _fd_links('/proc/%s/fd' % pid):
+        try:
+            target = os.readlink(link)
+        except OSError:
+            # Closed since the directory was listed
+            continue
+        if target.startswith(SOCKET_LINK):
+            sockets[int(target[len(SOCKET_LINK):-1])] = int(fd)
+    return sockets
+
+
+def _signature(pid):
+    """What changes when the file descriptors of ``pid`` may have changed:
+       the inode of its fd directory, which is new if the pid was reused,
+       and its size, which is the number of open file descriptors
+    """
+    stat = os.stat('/proc/%s/fd' % pid)
+    return stat.st_ino, stat.st_size
+
+
+class SocketOwnerIndex(object):
+    """Map socket inodes to the processes owning them.
+
+    :meth:`update` scans the fd directories of new processes, re-scans the
+    ones whose fd directory changed and forgets processes that exited.
+    The size of fd directories is their number of file descriptors, so a
+    process that closed as many as it opened since the last update is not
+    re-scanned; lookups detect when its cached sockets are stale or miss
+    its new sockets, and ``update(full=True)`` re-scans everything.
+    Kernels older than 6.2 report an empty size, so that only new
+    processes are scanned by :meth:`update` and new sockets are found by
+    lookups.
+
+    Lookups of unknown inodes force a re-scan of unchanged processes at
+    most once per ``retry_interval`` seconds for the whole index; inodes
+    still unknown after it, such as the sockets of processes whose file
+    descriptors are not readable, are remembered as unresolved until the
+    next one. Processes whose file descriptors are not readable are left
+    out.
+    """
+
+    def __init__(self, retry_interval=1.):
+        self.retry_interval = retry_interval
+        self._signatures = {}
+        # pid -> {inode: fd}
+        self._sockets = {}
+        # inode -> {pid: fd}
+        self._owners = {}
+        # Time of the last forced re-scan, and inodes not found since
+        self._rescanned = None
+        self._unresolved = set()
+
+    def _forget(self, pid):
+        self._signatures.pop(pid, None)
+        for inode in self._sockets.pop(pid, ()):
+            owners = self._owners[inode]
+            del owners[pid]
+            if not owners:
+                del self._owners[inode]
+
+    def _add(self, pid, signature, sockets):
+        self._signatures[pid] = signature
+        self._sockets[pid] = sockets
+        for inode, fd in sockets.items():
+            self._owners.setdefault(inode, {})[pid] = fd
+
+    def _scan(self, pids, full=False):
+        """Scan the fd directories of ``pids`` which changed, or all of
+           them with ``full``, and return the scanned process IDs
+        """
+        scanned = []
+        for pid in pids:
+            try:
+                signature = _signature(pid)
+            except OSError:
+                self._forget(pid)
+                continue
+            if not full and signature == self._signatures.get(pid):
+                continue
+            try:
+                sockets = socket_fds(pid)
+            except OSError:
+                # Not readable, remembered as such until it changes
+                sockets = {}
+            self._forget(pid)
+            self._add(pid, signature, sockets)
+            scanned.append(pid)
+        return scanned
+
+    def update(self, full=False):
+        """Update the index and return the process IDs that were scanned
+        """
+        pids = list_pids()
+        alive = set(pids)
+        for pid in [pid for pid in self._sockets if pid not in alive]:
+            self._forget(pid)
+        return self._scan(pids, full)
+
+    def _rescan(self, inodes):
+        """Force a re-scan of processes, unless one was done in the last
+           ``retry_interval`` seconds, until ``inodes`` are found: first
+           of the processes owning sockets, which may have replaced one,
+           then of the other ones
+        """
+        now = time.time()
+        if self._rescanned is not None and \
+           0 <= now - self._rescanned < self.retry_interval:
+            return
+        self._rescanned = now
+        owning = set(pid for pid, sockets in self._sockets.items()
+                     if sockets)
+        self._scan(sorted(owning), True)
+        if any(inode not in self._owners for inode in inodes):
+            self._scan([pid for pid in list_pids() if pid not in owning],
+                       True)
+            # Every process was scanned
+            self._unresolved = set()
+
+    def _stale(self, inode, owners):
+        """Return the owners that no longer have the socket ``inode``"""
+        link = '%s%d]' % (SOCKET_LINK, inode)
+        stale = []
+        for pid, fd in owners.items():
+            try:
+                if os.readlink('/proc/%s/fd/%s' % (pid, fd)) != link:
+                    stale.append(pid)
+            except OSError:
+                stale.append(pid)
+        return stale
+
+    def owners_many(self, inodes):
+        """Return a dict mapping each of ``inodes`` to the sorted IDs of
+           the processes owning it.
+
+        The cached owners are checked with a readlink each, and the index
+        is updated once when some of them are stale or inodes are unknown.
+        Unknown inodes are then looked for by a forced re-scan (see
+        :class:`SocketOwnerIndex`).
+        """
+        # Sockets in TIME_WAIT have no inode, and no owner
+        inodes = set(inode for inode in inodes if inode)
+        stale = []
+        for inode in inodes:
+            owners = self._owners.get(inode)
+            if owners:
+                stale.extend(self._stale(inode, owners))
+        for pid in stale:
+            # Re-scan it even if its fd directory looks the same
+            self._signatures.pop(pid, None)
+        missing = [inode for inode in inodes if inode not in self._owners]
+        if stale or any(inode not in self._unresolved for inode in missing):
+            self.update()
+            missing = [inode for inode in missing
+                       if inode not in self._owners]
+        if missing:
+            self._rescan(missing)
+            missing = [inode for inode in missing
+                       if inode not in self._owners]
+            self._unresolved.update(missing)
+        return dict((inode, sorted(self._owners.get(inode, ())))
+                    for inode in inodes)
+
+    def owners(self, inode):
+        """Return the IDs of the processes owning the socket ``inode``,
+           see :meth:`owners_many`
+        """
+        return self.owners_many([inode]).get(inode, [])
+
+    def owner(self, inode):
+        """Return the ID of the first process owning the socket ``inode``,
+           or ``None``
+        """
+        owners = self.owners(inode)
+        return owners[0] if owners else None
+
+    def fd(self, inode, pid):
+        """Return the file descriptor of the socket ``inode`` in ``pid``
+        """
+        return self._owners[inode][pid]
+
+    def __contains__(self, inode):
+        return inode in self._owners
+
+    def __len__(self):
+        return len(self._owners)
+
+    def __repr__(self):
+        return '<SocketOwnerIndex: %d sockets, %d processes>' % \
+            (len(self._owners), len(self._sockets))
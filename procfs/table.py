@@ -0,0 +1,181 @@
+"""Process table refreshed incrementally
+
+A :class:`ProcessTable` keeps a record per process across refreshes.
+Each refresh lists /proc and reads the volatile files of every process
+(``stat``, and ``statm`` for its fields), while the files that rarely
+change (``status`` and ``cmdline``) are only read for new processes and
+after an ``exec()``:
+
+    >>> table = ProcessTable(('ppid', 'uid', 'utime', 'stime', 'comm'))
+    >>> table.refresh()
+    >>> time.sleep(1)
+    >>> events = table.refresh()
+    >>> [(entry.pid, entry.comm) for entry in events.spawned]
+    [(4242, 'cron')]
+
+Processes are identified by their pid and start time, so that a pid
+reused between two refreshes is reported as an exited process and a
+spawned one.
+"""
+
+from array import array
+
+from procfs.core import Dict, list_pids
+from procfs.parallel import DEFAULT_CHUNKSIZE, map_chunks
+from procfs.records import record
+from procfs.scanner import DEFAULT_FIELDS, SOURCES, TEXT_FIELDS, scan_chunk
+
+
+# Files only read for new processes, and after an exec() (when their
+# comm changes) or a full refresh
+STATIC_SOURCES = ('status', 'cmdline')
+
+# Fields of every table: the identity of processes, and their comm to
+# detect exec() calls
+_IDENTITY_FIELDS = ('pid', 'start_time', 'comm')
+
+
+class ProcessEvents(object):
+    """Processes that were spawned and that exited between two
+       refreshes, as lists of table entries.
+
+    A process whose pid was reused is both in ``exited`` (the previous
+    process) and ``spawned`` (the new one).
+    """
+
+    def __init__(self, spawned, exited):
+        self.spawned = spawned
+        self.exited = exited
+
+    def __repr__(self):
+        return '<ProcessEvents: %d spawned, %d exited>' % \
+            (len(self.spawned), len(self.exited))
+
+
+class ProcessTable(object):
+    """Processes and their ``fields`` (see :mod:`procfs.scanner`), kept
+       up to date by :meth:`refresh`.
+
+    Entries are records of the fields (plus ``pid``, ``start_time`` and
+    ``comm``) indexed by pid. Fields read from :data:`STATIC_SOURCES` are
+    not re-read for processes that were already in the table, unless
+    their comm changed; the ``uid`` of a process calling ``setuid()`` is
+    updated by a ``refresh(full=True)``.
+
+    Reads are spread over ``executor`` by chunks of ``chunksize`` pids
+    (see :mod:`procfs.parallel`).
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS, executor=None,
+                 chunksize=DEFAULT_CHUNKSIZE):
+        unknown = [field for field in fields if field not in SOURCES]
+        if unknown:
+            raise ValueError('unknown fields: %s' % ', '.join(unknown))
+        self.fields = list(_IDENTITY_FIELDS) + [
+            field for field in fields if field not in _IDENTITY_FIELDS]
+        self._volatile = [field for field in self.fields
+                          if SOURCES[field] not in STATIC_SOURCES]
+        self._static = ['pid'] + [field for field in self.fields
+                                  if SOURCES[field] in STATIC_SOURCES]
+        self._entry = record('ProcessEntry', self.fields)
+        self._executor = executor
+        self._chunksize = chunksize
+        self._entries = {}
+        self._refreshed = False
+
+    def _read(self, fields, pids):
+        return map_chunks(scan_chunk, pids, self._executor,
+                          self._chunksize, (fields,))
+
+    def refresh(self, full=False):
+        """Update the table and return the :class:`ProcessEvents` since
+           the previous refresh, or ``None`` for the first one.
+
+        With ``full``, the static fields of every process are re-read.
+        """
+        entries = self._entries
+        spawned = []
+        exited = []
+        new = set()
+        # Processes whose static fields are read
+        pending = []
+        alive = set()
+        for row in self._read(self._volatile, list_pids()):
+            values = dict(zip(self._volatile, row))
+            pid = values['pid']
+            alive.add(pid)
+            entry = entries.get(pid)
+            if entry is not None and \
+               entry.start_time != values['start_time']:
+                # The pid was reused
+                exited.append(entry)
+                entry = None
+            if entry is None:
+                entry = entries[pid] = self._entry()
+                spawned.append(entry)
+                new.add(pid)
+                pending.append(pid)
+            elif full or entry.comm != values['comm']:
+                pending.append(pid)
+            for field, value in values.items():
+                entry[field] = value
+        for pid in [pid for pid in entries if pid not in alive]:
+            exited.append(entries.pop(pid))
+
+        if len(self._static) > 1 and pending:
+            read = set()
+            for row in self._read(self._static, pending):
+                entry = entries[row[0]]
+                read.add(row[0])
+                for field, value in zip(self._static, row):
+                    entry[field] = value
+            # Processes that exited before their static files were read
+            gone = set(pending).difference(read)
+            for pid in gone:
+                entry = entries.pop(pid)
+                if pid not in new:
+                    exited.append(entry)
+            if gone:
+                spawned = [entry for entry in spawned
+                           if entry.pid not in gone]
+
+        first = not self._refreshed
+        self._refreshed = True
+        if first:
+            return None
+        return ProcessEvents(spawned, exited)
+
+    def reset(self):
+        """Forget every process"""
+        self._entries = {}
+        self._refreshed = False
+
+    def columns(self):
+        """Return the fields of the processes as columns, like
+           :func:`procfs.scanner.scan`
+        """
+        pids = sorted(self._entries)
+        columns = Dict()
+        for field in self.fields:
+            values = [self._entries[pid][field] for pid in pids]
+            columns[field] = values if field in TEXT_FIELDS \
+                else array('l', values)
+        return columns
+
+    def __getitem__(self, pid):
+        return self._entries[pid]
+
+    def get(self, pid, default=None):
+        return self._entries.get(pid, default)
+
+    def __contains__(self, pid):
+        return pid in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(sorted(self._entries))
+
+    def __repr__(self):
+        return '<ProcessTable: %d processes>' % len(self._entries)
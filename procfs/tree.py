@@ -0,0 +1,117 @@
+"""Process tree index
+
+A :class:`ProcessTree` is built from a single scan of /proc/<pid>/stat
+files and answers parent, children, ancestors and descendants lookups
+without reading any other file.
+"""
+
+from datetime import timedelta
+
+from procfs.core import Dict, CLK_TCK
+from procfs.exceptions import UnknownProcessError
+from procfs.scanner import scan
+
+
+FIELDS = ('pid', 'ppid', 'start_time', 'utime', 'stime', 'rss')
+
+
+class ProcessTree(object):
+    """Parent/children index of processes.
+
+    ``table`` is a column table as returned by :func:`procfs.scanner.scan`
+    with at least the :data:`FIELDS` columns; processes are scanned when
+    it is not given.
+
+    A process whose parent is unknown, or started after it (the parent
+    exited and its pid was reused during the scan), is a root.
+    """
+
+    def __init__(self, table=None):
+        if table is None:
+            table = scan(FIELDS)
+        self._rows = {}
+        for row in zip(*[table[field] for field in FIELDS]):
+            self._rows[row[0]] = row
+        self._parents = {}
+        self._children = dict((pid, []) for pid in self._rows)
+        for pid, row in sorted(self._rows.items()):
+            parent = self._rows.get(row[1])
+            if parent is not None and parent[2] <= row[2] and pid != row[1]:
+                self._parents[pid] = row[1]
+                self._children[row[1]].append(pid)
+
+    def _check(self, pid):
+        if pid not in self._rows:
+            raise UnknownProcessError(pid)
+
+    def __contains__(self, pid):
+        return pid in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(sorted(self._rows))
+
+    @property
+    def roots(self):
+        """Processes without a known parent"""
+        return [pid for pid in sorted(self._rows) if pid not in self._parents]
+
+    def parent(self, pid):
+        """The parent process ID, or ``None`` for a root"""
+        self._check(pid)
+        return self._parents.get(pid)
+
+    def children(self, pid):
+        """The child process IDs"""
+        self._check(pid)
+        return list(self._children[pid])
+
+    def ancestors(self, pid):
+        """Parent, grand-parent, ... up to a root"""
+        self._check(pid)
+        ancestors = []
+        pid = self._parents.get(pid)
+        while pid is not None:
+            ancestors.append(pid)
+            pid = self._parents.get(pid)
+        return ancestors
+
+    def descendants(self, pid):
+        """All the processes below ``pid``, depth-first"""
+        self._check(pid)
+        descendants = []
+        stack = list(reversed(self._children[pid]))
+        while stack:
+            pid = stack.pop()
+            descendants.append(pid)
+            stack.extend(reversed(self._children[pid]))
+        return descendants
+
+    def subtree(self, pid):
+        """``pid`` and its descendants"""
+        return [pid] + self.descendants(pid)
+
+    def aggregate(self, pid):
+        """Resource usage of the ``pid`` subtree.
+
+        Returns the number of ``processes``, their ``utime``, ``stime``
+        and ``cpu_time`` as timedeltas, and their ``rss`` in pages.
+        """
+        utime = stime = rss = 0
+        pids = self.subtree(pid)
+        for pid in pids:
+            row = self._rows[pid]
+            utime += row[3]
+            stime += row[4]
+            rss += row[5]
+        return Dict(processes=len(pids),
+                    utime=timedelta(seconds=utime / float(CLK_TCK)),
+                    stime=timedelta(seconds=stime / float(CLK_TCK)),
+                    cpu_time=timedelta(seconds=(utime + stime) /
+                                       float(CLK_TCK)),
+                    rss=rss)
+
+    def __repr__(self):
+        return '<ProcessTree: %d processes>' % len(self)
@@ -1,16 +1,68 @@
 """Utilities"""
 
-import sys
+import threading
+from collections import OrderedDict, deque
 
 
-def get_module(name):
-    """Get a module by its name.
+class LRUCache(object):
+    """Mapping keeping at most ``maxsize`` recently used items"""
 
-    If it's not already loaded, it imports it.
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class BoundedCache(dict):
+    """Dict keeping at most ``maxsize`` items, the first inserted one being
+       evicted first.
+
+    Unlike :class:`LRUCache`, lookups are plain dict lookups, without a
+    lock nor reordering: only insertions evict items.
     """
-    if name not in sys.modules:
-        try:
-            __import__(name)
-        except ImportError:
-            pass
-    return sys.modules.get(name)
+
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        super(BoundedCache, self).__init__()
+        self.maxsize = maxsize
+        self._order = deque()
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            while len(self._order) >= self.maxsize:
+                self.pop(self._order.popleft(), None)
+            self._order.append(key)
+        super(BoundedCache, self).__setitem__(key, value)
+
+    def clear(self):
+        super(BoundedCache, self).clear()
+        self._order.clear()
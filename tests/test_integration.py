@@ -6,10 +6,18 @@ procfs integration tests
 A set of simple tests that are executed against the real /proc directory
 """
 
+import os
+import socket
+import subprocess
+
 import pytest
 
 import procfs
-from procfs.exceptions import PathNotFoundError, NoParentProcessError
+from procfs import netlink
+from procfs.core import Process
+from procfs.exceptions import PathNotFoundError, NoParentProcessError, \
+    ProcessGoneError
+from procfs.parallel import process_pool
 
 @pytest.fixture
 def proc():
@@ -52,7 +60,6 @@ def test_proc_self_environ(proc):
 def test_proc_self_statm(proc):
     assert proc.self.statm['size']
 
-@pytest.mark.xfail(reason="Probably a bug")
 def test_proc_self_smaps(proc):
     assert proc.self.smaps.keys()
 
@@ -118,3 +125,96 @@ def test_diskstats(proc):
 
 def test_vmstat(proc):
     assert len(proc.vmstat.keys()) > 90
+
+def test_file_pool(proc):
+    pooled = procfs.Proc(pool_size=2)
+    assert pooled.meminfo['MemTotal'] == proc.meminfo['MemTotal']
+    assert 'cpu' in pooled.stat.keys()
+    assert 'average' in pooled.loadavg.keys()
+    assert len(pooled._pool) == 2
+    pooled.close()
+    assert not len(pooled._pool)
+
+def test_parallel_scan(proc):
+    pool = process_pool(2)
+    try:
+        fields = ['ppid', 'comm', 'uid']
+        sequential = proc.processes.scan(fields)
+        parallel = proc.processes.parallel(pool, chunksize=8).scan(fields)
+    finally:
+        pool.terminate()
+    assert parallel == sequential
+
+def test_netlink_records(proc):
+    server = socket.socket()
+    try:
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        expected = list(proc.self.net.tcp.records(local_port=port))
+        try:
+            records = list(netlink.records('tcp', state='LISTEN',
+                                           local_port=port, fallback=False))
+        except EnvironmentError:
+            pytest.skip('sock_diag netlink sockets are not available')
+    finally:
+        server.close()
+    assert [(r.local_address, r.local_port, r.st, r.uid, r.inode)
+            for r in records] == \
+        [(r.local_address, r.local_port, r.st, r.uid, r.inode)
+         for r in expected]
+
+def test_smaps_totals(proc):
+    smaps = proc.self.smaps
+    fields = ['Rss', 'Pss', 'Swap', 'Private_Dirty']
+    assert set(smaps.totals(fields)) == set(fields)
+    assert sum(group.Rss for group in smaps.aggregate().values()) > 0
+
+def test_memory_report(proc):
+    report = proc.processes.memory()
+    usage = report.process(os.getpid())
+    assert 0 < usage.uss <= usage.pss <= usage.rss
+    assert report.cost.processes == len(report)
+
+def test_thread_handlers():
+    pid = os.getpid()
+    thread = Process(pid).task[str(pid)]
+    assert isinstance(thread.stat, procfs.processes.stat)
+    assert thread.stat.pid == pid
+
+def test_pinned_process_gone():
+    child = subprocess.Popen(['sleep', '60'])
+    try:
+        with Process(child.pid, pinned=True) as process:
+            assert process.pinned
+            assert process.stat.tcomm == '(sleep)'
+            assert process.exe == os.readlink('/proc/%d/exe' % child.pid)
+            assert process.fd['0'] == os.readlink('/proc/%d/fd/0' % child.pid)
+            child.kill()
+            child.wait()
+            with pytest.raises(ProcessGoneError):
+                process.stat
+            with pytest.raises(ProcessGoneError):
+                process.status()
+            with pytest.raises(ProcessGoneError):
+                process.exe
+            with pytest.raises(ProcessGoneError):
+                process.smaps.totals()
+    finally:
+        if child.returncode is None:
+            child.kill()
+            child.wait()
+
+def test_process_table(proc):
+    table = proc.processes.table()
+    assert table.refresh() is None
+    child = subprocess.Popen(['sleep', '60'])
+    try:
+        events = table.refresh()
+        assert child.pid in [entry.pid for entry in events.spawned]
+        assert table[os.getpid()].pid == os.getpid()
+    finally:
+        child.kill()
+        child.wait()
+    events = table.refresh()
+    assert child.pid in [entry.pid for entry in events.exited]
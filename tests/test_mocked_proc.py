@@ -8,11 +8,26 @@ A set of simple tests that are executed against the real /proc directory
 
 from os import readlink, listdir
 from os.path import exists, isdir, isfile
+import errno
 import os
+import socket
+import struct
+import sys
+import timeit
+from datetime import timedelta
 import pytest
 
 import procfs
-from procfs.exceptions import PathNotFoundError, NoParentProcessError
+from procfs import churn, connections, cpu, disk, memory, netlink, rate, \
+    sockets, table
+from procfs.exceptions import PathNotFoundError, NoParentProcessError, \
+    UnknownProcessError
+from procfs.parallel import thread_pool
+from procfs.processes import net
+from procfs.processes.net import AddressDecoder, Listener
+from procfs.records import Record
+from procfs.registry import Registry
+from procfs.utils import BoundedCache, LRUCache
 
 
 SkipTest = pytest.mark.skipif(True, reason='skipped')
@@ -110,6 +125,61 @@ def mock_exists(monkeypatch):
     monkeypatch.setattr(procfs.core.os.path, 'exists', mock_exists)
 
 
+@pytest.fixture(autouse=True)
+def mock_stat(monkeypatch):
+    stat = os.stat
+
+    def mock_stat(path):
+        if isinstance(path, str) and path.startswith('/proc'):
+            path = os.path.join('data', path[1:])
+
+        return stat(path)
+
+    monkeypatch.setattr(procfs.core.os, 'stat', mock_stat)
+
+
+@pytest.fixture(autouse=True)
+def mock_lstat(monkeypatch):
+    lstat = os.lstat
+
+    def mock_lstat(path):
+        if isinstance(path, str) and path.startswith('/proc'):
+            path = os.path.join('data', path[1:])
+
+        return lstat(path)
+
+    monkeypatch.setattr(procfs.core.os, 'lstat', mock_lstat)
+
+
+@pytest.fixture(autouse=True)
+def mock_scandir(monkeypatch):
+    scandir = procfs.core.scandir
+    if scandir is None:
+        return
+
+    def mock_scandir(path):
+        if path.startswith('/proc'):
+            path = os.path.join('data', path[1:])
+
+        return scandir(path)
+
+    monkeypatch.setattr(procfs.core, 'scandir', mock_scandir)
+    monkeypatch.setattr(sockets, 'scandir', mock_scandir)
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def numpy_backend(request, monkeypatch):
+    """Run a test with NumPy, if it is installed, and without it: the
+       test calls it with the module to run without NumPy
+    """
+    def use(module):
+        if request.param == 'array':
+            monkeypatch.setattr(module, 'numpy', None)
+        elif module.numpy is None:
+            pytest.skip('numpy is not installed')
+    return use
+
+
 @pytest.fixture(autouse=True)
 def mock_readfile(monkeypatch, request):
     """Record/replay reads to/from file"""
@@ -138,6 +208,16 @@ def mock_readfile(monkeypatch, request):
     monkeypatch.setattr(procfs.core, 'readfile', replay)
 
 
+@pytest.fixture(autouse=True)
+def mock_iterlines(monkeypatch):
+    iterlines = procfs.core.iterlines
+
+    def replay(fn, size=65536):
+        return iterlines(os.path.join('data', fn.lstrip('/')), size)
+
+    monkeypatch.setattr(procfs.core, 'iterlines', replay)
+
+
 @pytest.fixture
 def proc():
     return procfs.Proc()
@@ -213,7 +293,6 @@ def test_first_process_statm(first):
     assert first.statm['size']
 
 
-@pytest.mark.xfail(reason="Probably a bug")
 def test_first_process_smaps(first):
     assert first.smaps.keys()
 
@@ -265,7 +344,6 @@ def test_proc_self_statm(proc):
     assert proc.self.statm['size']
 
 
-@pytest.mark.xfail(reason="Probably a bug")
 def test_proc_self_smaps(proc):
     assert proc.self.smaps.keys()
 
@@ -337,3 +415,975 @@ def test_diskstats(proc):
 
 def test_vmstat(proc):
     assert len(proc.vmstat.keys()) > 70
+
+
+# snapshots
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Record the paths read through procfs.core.readfile"""
+    paths = []
+    replay = procfs.core.readfile
+
+    def recording_readfile(fn):
+        paths.append(fn)
+        return replay(fn)
+
+    monkeypatch.setattr(procfs.core, 'readfile', recording_readfile)
+    return paths
+
+
+def test_snapshot_reads_once(proc, reads):
+    with proc.snapshot():
+        assert proc.meminfo.MemFree
+        assert proc.meminfo.MemTotal
+        assert proc.meminfo['Cached'] >= 0
+    assert reads == ['/proc/meminfo']
+
+
+def test_snapshot_scope(proc, reads):
+    with proc.snapshot():
+        proc.loadavg.average
+    proc.loadavg.average
+    assert reads == ['/proc/loadavg', '/proc/loadavg']
+
+
+def test_process_snapshot(proc, reads):
+    process = proc.processes(1)
+    with process.snapshot():
+        assert process.status.Name
+        assert process.status.Uid
+        assert process.stat.ppid == 0
+        proc.meminfo.MemFree
+        proc.meminfo.MemFree
+    assert reads.count('/proc/1/status') == 1
+    assert reads.count('/proc/1/stat') == 1
+    assert reads.count('/proc/meminfo') == 2
+
+
+# bulk scanning
+
+
+def test_scan(proc):
+    table = proc.processes.scan(['ppid', 'comm', 'utime', 'rss', 'uid'])
+    assert list(table.pid) == [1, 3756]
+    assert list(table.ppid) == [0, 1]
+    assert table.comm == ['systemd', 'dbus-daemon']
+    assert table.utime[0] == 898
+    assert table.rss[0] == 596
+    assert list(table.uid) == [0, 1000]
+
+
+def test_scan_status_only(proc):
+    table = proc.processes.scan(['uid', 'cmdline'])
+    assert len(table.pid) == len(proc.processes)
+    assert list(table.pid) == sorted(table.pid)
+    assert len([uid for uid in table.uid if uid == 0]) == 55
+    assert table.cmdline[0] == proc.processes(1).cmdline()
+
+
+def test_scan_filtered(proc):
+    table = proc.processes.cmdline('dbus').scan(['comm'])
+    assert table.comm == ['dbus-daemon']
+
+
+def test_scan_unknown_field(proc):
+    with pytest.raises(ValueError):
+        proc.processes.scan(['not_a_field'])
+
+
+# parallel scanning
+
+
+# Created before the os module gets mocked
+THREAD_POOL = thread_pool(4)
+
+
+@pytest.fixture
+def executor():
+    return THREAD_POOL
+
+
+def test_parallel_scan(proc, executor):
+    fields = ['ppid', 'comm', 'utime', 'rss', 'uid', 'cmdline']
+    sequential = proc.processes.scan(fields)
+    parallel = proc.processes.parallel(executor, chunksize=5).scan(fields)
+    assert parallel == sequential
+
+
+def test_parallel_filters(proc, executor):
+    sequential = [p.id for p in proc.processes.uid(0)]
+    parallel = proc.processes.parallel(executor, chunksize=3).uid(0)
+    parallel = [p.id for p in parallel]
+    assert parallel == sequential
+    assert parallel == sorted(parallel)
+    assert len(parallel) == 55
+    matches = proc.processes.parallel(executor, chunksize=3).cmdline('^/')
+    assert [p.id for p in matches] == [1, 3756]
+
+
+# field-selective parsing
+
+
+def test_status_field(proc):
+    status = proc.processes(3756).status
+    assert status.Name == 'dbus-daemon'
+    assert status.Uid.real == 1000
+    assert status.PPid == 1
+    assert status.VmPeak == 33972
+    assert status.Groups == status()['Groups']
+    with pytest.raises(AttributeError):
+        status.NotAField
+    assert 'Name' in status.keys()
+
+
+def test_stat_field(proc):
+    stat = proc.processes(1).stat
+    full = stat()
+    for key in full:
+        assert stat[key] == full[key]
+    assert stat.tcomm == '(systemd)'
+    assert stat.start_time == full['start_time']
+
+
+def test_stat_comm_with_spaces():
+    from procfs.processes import stat
+    handler = stat.__new__(stat)
+    data = open('data/proc/1/stat').read().replace('(systemd)', '(a (b) c)')
+    assert handler._parse(data)['tcomm'] == '(a (b) c)'
+    assert handler._parse(data)['ppid'] == 0
+    assert handler._parse_field(data, 'ppid') == 0
+    assert handler._parse_field(data, 'state') == 'S'
+
+
+# records
+
+
+def test_records(proc):
+    stat = proc.processes(1).stat()
+    assert stat.__class__.__name__ == 'ProcStat'
+    assert stat.keys()[:3] == ['pid', 'tcomm', 'state']
+    assert stat['ppid'] == stat.ppid == 0
+    assert stat.get('not_a_field') is None
+    assert 'utime' in stat and 'not_a_field' not in stat
+    assert dict(stat.items()) == stat
+    # Repeated strings are shared
+    assert stat.state is proc.processes(3756).stat().state
+    status = proc.processes(3756).status()
+    assert status.Uid == {'real': 1000, 'effective': 1000,
+                          'saved_set': 1000, 'fs': 1000}
+    status['Added_by_newer_kernels'] = 1
+    assert status.Added_by_newer_kernels == 1
+    assert status.keys()[-1] == 'Added_by_newer_kernels'
+    with pytest.raises(KeyError):
+        proc.stat().cpu['not_a_field']
+    row = proc.processes(1).net.tcp()[0]
+    assert row['tm->when'] == row.tm_when
+
+
+def test_record_size(proc):
+    records = [proc.processes(1).stat(), proc.processes(1).status(),
+               proc.stat().cpu, proc.processes(1).net.tcp()[0]]
+    for record in records:
+        assert isinstance(record, Record)
+        as_dict = procfs.core.Dict(record.items())
+        assert sys.getsizeof(as_dict) >= 3 * sys.getsizeof(record)
+
+
+def test_record_parse_time():
+    stat = procfs.processes.stat(1)
+    status = procfs.processes.status(1)
+    stat_data = open('data/proc/1/stat').read()
+    status_data = open('data/proc/1/status').read()
+
+    # How fields were parsed before records: an item set per field
+    def stat_dict():
+        pid, comm, values = procfs.processes.split_stat(stat_data)
+        result = procfs.core.Dict()
+        for key, value in zip(stat._header, [pid, '(%s)' % comm] + values):
+            if key != '_':
+                result[key] = stat._parse_value(key, value)
+        return result
+
+    def status_dict():
+        result = procfs.core.Dict()
+        for line in status_data.splitlines():
+            name, value = line.split(':\t')
+            result[name] = status._parse_value(name, value)
+        return result
+
+    def duration(function):
+        return min(timeit.repeat(function, number=200, repeat=5))
+
+    assert stat._parse(stat_data) == stat_dict()
+    assert status._parse(status_data) == status_dict()
+    assert duration(lambda: stat._parse(stat_data)) < \
+        1.3 * duration(stat_dict)
+    assert duration(lambda: status._parse(status_data)) < \
+        1.3 * duration(status_dict)
+
+
+# handler registry
+
+
+def test_registry():
+    registry = Registry()
+    registry.register('<pid>/stat', procfs.processes.stat)
+    registry.register('sys/*', procfs.core.File)
+    assert registry.lookup('<pid>/stat') is procfs.processes.stat
+    assert registry.lookup('sys/kernel') is procfs.core.File
+    assert registry.lookup('<pid>/unknown') is None
+    assert registry._resolved['<pid>/unknown'] is None
+    registry.unregister('sys/*')
+    assert registry.lookup('sys/kernel') is None
+    assert len(registry) == 1
+    with pytest.raises(KeyError):
+        registry.unregister('sys/*')
+    with pytest.raises(ValueError):
+        registry.register('/proc/stat', procfs.core.File)
+
+
+def test_thread_directory_pattern():
+    directory = procfs.core.ProcessDirectory.__new__(
+        procfs.core.ProcessDirectory)
+    assert directory._directory_pattern('/proc/1') == '<pid>/'
+    assert directory._directory_pattern('/proc/1/task') == '<pid>/task/'
+    assert directory._directory_pattern('/proc/1/task/2') == '<pid>/'
+    assert directory._directory_pattern('/proc/1/task/2/net') == \
+        '<pid>/net/'
+
+
+def test_handler_arguments(proc):
+    # pool and check follow the path in the same order for all handlers
+    pool = object()
+    assert procfs.core.File('/proc/stat', pool, False)._pool is pool
+    assert procfs.core.ProcessFile(1, 'stat', pool, False)._pool is pool
+
+
+def test_register_handler(proc):
+    class cmdline(procfs.core.ProcessFile):
+        def _parse(self, data):
+            return data.rstrip('\0').split('\0')
+
+    assert procfs.handlers.lookup('<pid>/net') is net.NetDirectory
+    assert procfs.handlers.lookup('<pid>/net/rpc/nfsd') is \
+        procfs.processes.net.rpc.nfsd
+    assert procfs.handlers.lookup('fs/nfsd/pool_stats') is \
+        procfs.proc.fs.nfsd.pool_stats
+    assert isinstance(proc.processes(1).net.tcp, net.tcp)
+    procfs.register('<pid>/cmdline', cmdline)
+    try:
+        assert proc.processes(1).cmdline()[:2] == \
+            ['/lib/systemd/systemd', '--system']
+    finally:
+        procfs.register('<pid>/cmdline', procfs.processes.cmdline)
+
+
+# path resolution
+
+
+def test_path_resolution_calls(proc, monkeypatch):
+    calls = []
+
+    def counted(module, name):
+        function = getattr(module, name)
+        monkeypatch.setattr(module, name, lambda path: calls.append(name) or
+                            function(path))
+
+    for name in ('stat', 'lstat'):
+        counted(procfs.core.os, name)
+    for name in ('exists', 'isdir', 'isfile', 'islink'):
+        counted(procfs.core.os.path, name)
+    process = procfs.core.Process(1)
+    assert calls == ['stat']
+    assert process.stat.ppid == 0
+    assert calls == ['stat', 'lstat']
+    del calls[:]
+    if procfs.core.scandir is not None:
+        assert 'statm' in dir(process)
+        assert process.statm.size
+        assert calls == []
+    with pytest.raises(PathNotFoundError):
+        process.not_a_file
+    with pytest.raises(UnknownProcessError):
+        procfs.core.Process(4)
+
+
+# filters
+
+
+def test_filters_are_lazy(proc, reads):
+    processes = proc.processes.uid(0).cmdline('systemd')
+    assert not reads
+    assert [p.id for p in processes] == [1]
+
+
+def test_filters_cheapest_first(proc, reads):
+    processes = proc.processes.cmdline('systemd').name('^systemd$')
+    assert len(processes) == 1
+    assert [path for path in reads if 'cmdline' in path] == ['/proc/1/cmdline']
+    assert processes[0].id == 1
+
+
+def test_filters_uid(proc, monkeypatch):
+    # Recorded /proc/<pid> directories are all owned by root
+    assert [p.id for p in proc.processes.uid(1000)] == [3756]
+    assert len(proc.processes.uid(0)) == 55
+
+    class Owner(object):
+        st_uid = 1000
+        st_mode = 0o40555  # directory
+
+    stat = os.stat
+
+    def owned_stat(path):
+        return Owner if path.startswith('/proc/') else stat(path)
+
+    monkeypatch.setattr(procfs.core.os, 'stat', owned_stat)
+    assert len(proc.processes.uid(1000)) == len(proc.processes)
+    assert len(proc.processes.uid(0)) == 0
+
+
+# process tree
+
+
+def test_process_tree(proc):
+    tree = proc.processes.tree()
+    assert list(tree) == [1, 3756]
+    assert tree.roots == [1]
+    assert tree.parent(1) is None
+    assert tree.parent(3756) == 1
+    assert tree.children(1) == [3756]
+    assert tree.ancestors(3756) == [1]
+    assert tree.descendants(1) == [3756]
+    usage = tree.aggregate(1)
+    assert usage.processes == 2
+    assert usage.rss == 596 + 288
+    assert usage.cpu_time == usage.utime + usage.stime
+    with pytest.raises(UnknownProcessError):
+        tree.children(2)
+
+
+def test_process_tree_deep():
+    from procfs.tree import ProcessTree
+    # 1 -> 2 -> 3 -> 4, 2 -> 5, and 6 whose parent 7 started after it
+    table = {'pid': [1, 2, 3, 4, 5, 6, 7],
+             'ppid': [0, 1, 2, 3, 2, 7, 1],
+             'start_time': [0, 1, 2, 3, 4, 5, 6],
+             'utime': [1] * 7, 'stime': [2] * 7, 'rss': [10] * 7}
+    tree = ProcessTree(table)
+    assert tree.roots == [1, 6]
+    assert tree.subtree(2) == [2, 3, 4, 5]
+    assert tree.ancestors(4) == [3, 2, 1]
+    assert tree.children(7) == []
+    assert tree.aggregate(2).rss == 40
+    assert tree.aggregate(1).processes == 6
+
+
+# cpu utilization
+
+
+def _cpu_samples():
+    content = open('data/proc/stat').read()
+    before = cpu.CpuSample(content, timestamp=10)
+    lines = content.splitlines()
+    # cpu1: 60 user, 20 system and 20 idle ticks more; other cpus idle
+    lines[0] = 'cpu  15382772 118584 3387716 33933518 135513 128 28327 0 0 0'
+    lines[2] = 'cpu1 3812209 38814 845256 245672 3622 0 775 0 0 0'
+    for index in (1, 3, 4):
+        values = lines[index].split()
+        values[4] = str(int(values[4]) + 100)
+        lines[index] = ' '.join(values)
+    after = cpu.CpuSample('\n'.join(lines), timestamp=11)
+    return before, after
+
+
+def test_cpu_utilization(numpy_backend):
+    numpy_backend(cpu)
+    before, after = _cpu_samples()
+    assert before.names == ['cpu', 'cpu0', 'cpu1', 'cpu2', 'cpu3']
+    usage = cpu.utilization(before, after)
+    assert usage.interval == 1
+    assert usage['cpu1'].user == 60
+    assert usage['cpu1'].system == 20
+    assert usage['cpu1'].busy == 80
+    assert usage['cpu0'].busy == 0
+    assert usage['cpu'].busy == 20
+    assert list(usage.busy) == [20, 0, 80, 0, 0]
+
+
+def test_cpu_sampler(proc):
+    sampler = cpu.CpuSampler()
+    assert sampler.sample() is None
+    assert sampler.sample()['cpu'].busy == 0
+
+
+# rates
+
+
+def test_rate_nested(proc):
+    before = proc.processes(1).net.dev
+    after = before()
+    after['lo']['receive']['bytes'] += 1000
+    after['wlan1'] = after.pop('wlan0')
+    result = rate.rate(before, 10, after, 12)
+    assert result.lo.receive.bytes == 500
+    assert result.lo.transmit.bytes == 0
+    assert 'wlan0' not in result
+    assert 'wlan1' not in result
+
+
+def test_rate_records(proc):
+    before = proc.stat()
+    after = proc.stat()
+    after.cpu0.user += timedelta(seconds=2)
+    after.ctxt += 50
+    result = rate.delta(before, after)
+    assert result.cpu0.user == 2
+    assert result.cpu.user == 0
+    assert result.ctxt == 50
+    process = proc.processes(1).stat()
+    assert rate.delta(process, process).utime == 0
+
+
+def test_rate_wrap_and_reset():
+    before = {'wrapped': 2 ** 32 - 10, 'reset': 1000, 'big': 2 ** 64 - 1}
+    after = {'wrapped': 5, 'reset': 7, 'big': 1}
+    assert rate.delta(before, after) == {'wrapped': 15, 'reset': 7, 'big': 2}
+
+
+def test_rate_engine():
+    engine = rate.Rate()
+    assert engine.update({'a': {'b': 1}}, 0) is None
+    assert engine.update({'a': {'b': 3}}, 2) == {'a': {'b': 1}}
+    assert engine.update({'a': {'b': 5, 'c': 1}}, 3) == {'a': {'b': 2}}
+    assert engine.update({'a': {'b': 5, 'c': 2}}, 4) == {'a': {'b': 0, 'c': 1}}
+    # Same size, other keys
+    assert engine.update({'a': {'b': 7, 'd': 1}}, 5) == {'a': {'b': 2}}
+
+
+def test_rate_layout(monkeypatch):
+    engine = rate.Delta()
+    engine.update({'a': {'b': 1, 'c': 'text'}, 'd': 1})
+    monkeypatch.setattr(rate, '_walk', None)
+    assert engine.update({'a': {'b': 3, 'c': 'text'}, 'd': 4}) == \
+        {'a': {'b': 2}, 'd': 3}
+
+
+# disk metrics
+
+
+def test_disk_metrics(numpy_backend):
+    numpy_backend(disk)
+    content = open('data/proc/diskstats').read()
+    before = disk.DiskSample(content, timestamp=0)
+    lines = [line for line in content.splitlines() if ' sda2 ' not in line]
+    values = lines[0].split()
+    # sda: 100 reads of 8 sectors in 300ms, 50 writes in 200ms,
+    # busy for 500ms, 1000ms of weighted time, 2 discards in 4ms
+    for index, increment in ((3, 100), (5, 800), (6, 300), (7, 50),
+                             (10, 200), (12, 500), (13, 1000)):
+        values[index] = str(int(values[index]) + increment)
+    values += ['2', '0', '16', '4']
+    lines[0] = ' '.join(values)
+    lines.append('259 0 nvme0n1 1 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0')
+    after = disk.DiskSample('\n'.join(lines), timestamp=2)
+
+    result = disk.metrics(before, after)
+    assert 'sda2' not in result.devices
+    assert 'nvme0n1' not in result.devices
+    sda = result['sda']
+    assert sda['r/s'] == 50
+    assert sda['w/s'] == 25
+    assert sda['rkB/s'] == 200
+    assert sda['r_await'] == 3
+    assert sda['w_await'] == 4
+    assert sda['await'] == 504 / 152.
+    assert sda['avgqu-sz'] == 0.5
+    assert sda['%util'] == 25
+    assert sda['d/s'] == 1
+    assert sda['d_await'] == 2
+    assert result['sda1']['%util'] == 0
+
+
+def test_diskstats_discard_columns(proc, monkeypatch):
+    content = '   8       0 sda 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17\n'
+    monkeypatch.setattr(procfs.core, 'readfile', lambda fn: content)
+    sda = proc.diskstats['sda']
+    assert sda['io']['weighted_milliseconds'] == 11
+    assert sda['discard'] == {'completed': 12, 'merged': 13, 'sectors': 14,
+                              'milliseconds': 15}
+    assert sda['flush'] == {'completed': 16, 'milliseconds': 17}
+
+
+# streaming socket tables
+
+
+def test_iterlines():
+    lines = open('data/proc/1/net/tcp').read().splitlines()
+    assert list(procfs.core.iterlines('/proc/1/net/tcp', 7)) == lines
+
+
+def test_tcp_records(proc):
+    tcp = proc.processes(1).net.tcp
+    records = list(tcp.records())
+    assert len(records) == 6
+    assert records[0].local_address == '127.0.0.1'
+    assert records[0].local_port == 9150
+    assert records[0].st == 'LISTEN'
+    assert records[0].uid == 1000
+    as_dict = tcp()
+    for record in records:
+        assert as_dict[record.slot]['inode'] == record.inode
+        assert as_dict[record.slot]['local_address'] == \
+            (record.local_address, record.local_port)
+
+
+def test_udp_records(proc):
+    records = list(proc.processes(1).net.udp.records())
+    assert [(r.slot, r.local_port, r.st, r.inode) for r in records] == \
+        [(519, 68, '07', 10808720)]
+
+
+def test_tcp_records_pushdown(proc, monkeypatch):
+    tcp = proc.processes(1).net.tcp
+    decoded = []
+    parse_addr = tcp._parse_addr
+    monkeypatch.setattr(tcp, '_parse_addr',
+                        lambda addr: decoded.append(addr) or parse_addr(addr))
+    listening = list(tcp.records(state='LISTEN', local_port=9150))
+    assert [r.local_port for r in listening] == [9150]
+    assert len(decoded) == 2
+    assert len(list(tcp.records(state='0A'))) == \
+        len([r for r in tcp.records() if r.st == 'LISTEN'])
+    assert list(tcp.records(uid=0, local_port=[9150, 9151])) == []
+    assert list(tcp.records(remote_port=[])) == []
+
+
+# IPv6 and raw socket tables
+
+
+def test_address_decoder():
+    decode = AddressDecoder()
+    assert decode('0100007F') == '127.0.0.1'
+    assert decode('00000000000000000000000000000000') == '::'
+    assert decode('00000000000000000000000001000000') == '::1'
+    assert decode('0000000000000000FFFF00000100007F') == '::ffff:127.0.0.1'
+    assert decode.packed('0100007F') == b'\x7f\x00\x00\x01'
+
+
+def test_address_decoder_cache(monkeypatch):
+    decode = AddressDecoder(maxsize=2)
+    calls = []
+    packed = decode.packed
+    monkeypatch.setattr(decode, 'packed',
+                        lambda addr: calls.append(addr) or packed(addr))
+    for addr in ('0100007F', '0100007F', '00000000', '0100007F',
+                 '0101A8C0', '00000000'):
+        decode(addr)
+    # The first inserted address is evicted first
+    assert calls == ['0100007F', '00000000', '0101A8C0']
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert len(cache) == 2
+    with pytest.raises(ValueError):
+        LRUCache(0)
+
+
+def test_bounded_cache():
+    cache = BoundedCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['a'] = 3
+    cache['c'] = 4
+    assert cache == {'b': 2, 'c': 4}
+    cache.clear()
+    cache['d'] = 5
+    assert cache == {'d': 5}
+    with pytest.raises(ValueError):
+        BoundedCache(0)
+
+
+def test_tcp6_records(proc):
+    net = proc.processes(1).net
+    records = list(net.tcp6.records())
+    assert [(r.local_address, r.local_port, r.st) for r in records] == [
+        ('::', 443, 'LISTEN'), ('::1', 8080, 'LISTEN'),
+        ('::1', 59210, 'ESTABLISHED'), ('::1', 8080, 'ESTABLISHED')]
+    assert records[2].remote_address == '::1'
+    assert records[2].remote_port == 8080
+    assert [r.inode for r in net.tcp6.records(state='LISTEN', uid=1000)] == \
+        [11916]
+    assert net.tcp6[1]['rem_address'] == ('::', 0)
+
+
+def test_udp6_raw_records(proc):
+    net = proc.processes(1).net
+    assert [(r.local_address, r.local_port) for r in net.udp6.records()] == \
+        [('::', 5353), ('::ffff:127.0.0.1', 5354)]
+    assert net.udp6[3274]['drops'] == '0'
+    assert [(r.local_address, r.local_port) for r in net.raw.records()] == \
+        [('0.0.0.0', 1)]
+    assert [(r.local_address, r.local_port) for r in net.raw6.records()] == \
+        [('::', 58)]
+
+
+# sock_diag netlink backend
+
+
+def test_netlink_parse_messages():
+    payload = struct.pack('=BBBB', socket.AF_INET, 10, 0, 0) + \
+        struct.pack('>HH16s16s12x', 8080, 0, b'\x7f\x00\x00\x01', b'') + \
+        struct.pack('=IIIII', 0, 3, 128, 1000, 4242)
+    message = struct.pack('=IHHII', 16 + len(payload),
+                          netlink.SOCK_DIAG_BY_FAMILY, 2, 1, 0) + payload
+    done = struct.pack('=IHHIIi', 20, netlink.NLMSG_DONE, 2, 1, 0, 0)
+    messages, finished = netlink.parse_messages(message + message + done)
+    assert finished
+    assert len(messages) == 2
+    (family, state, _, _), (sport, _, src, _), counters = messages[0]
+    assert (family, state, sport) == (socket.AF_INET, 10, 8080)
+    assert src[:4] == b'\x7f\x00\x00\x01'
+    assert counters == (0, 3, 128, 1000, 4242)
+    assert netlink.parse_messages(message) == (messages[:1], False)
+    error = struct.pack('=IHHIIi', 20, netlink.NLMSG_ERROR, 0, 1, 0, -1)
+    with pytest.raises(OSError):
+        netlink.parse_messages(error)
+
+
+def test_netlink_fallback(proc, monkeypatch):
+    def denied(*args):
+        raise socket.error(errno.EPERM, 'Operation not permitted')
+
+    monkeypatch.setattr(netlink.socket, 'socket', denied)
+    records = list(netlink.records('tcp', state='LISTEN'))
+    assert records == list(proc.processes(1).net.tcp.records('LISTEN'))
+    with pytest.raises(socket.error):
+        netlink.records('tcp', fallback=False)
+    with pytest.raises(ValueError):
+        netlink.records('sctp')
+
+
+# socket owners
+
+
+def test_socket_fds():
+    assert sockets.socket_fds(1) == {4932588: 3, 10808720: 4}
+    assert sockets.socket_fds(3756) == {4932589: 3, 4932588: 7}
+
+
+def test_socket_owner_index(monkeypatch):
+    index = sockets.SocketOwnerIndex()
+    assert index.update() == [1, 3756]
+    assert len(index) == 3
+    assert index.owners(4932588) == [1, 3756]
+    assert index.owner(4932589) == 3756
+    assert index.fd(4932588, 3756) == 7
+    assert index.update() == []
+    assert index.update(full=True) == [1, 3756]
+    assert index.owner(12345) is None
+
+    monkeypatch.setattr(sockets, 'list_pids', lambda: [1])
+    assert index.update() == []
+    assert 4932589 not in index
+    assert index.owners(4932588) == [1]
+
+
+def test_socket_owner_index_stale(monkeypatch):
+    index = sockets.SocketOwnerIndex()
+    index.update()
+    readlink = os.readlink
+    monkeypatch.setattr(os, 'readlink',
+                        lambda path: 'pipe:[1]' if path.endswith('/1/fd/3')
+                        else readlink(path))
+    assert index.owners(4932588) == [3756]
+    assert index.owners(10808720) == [1]
+    assert index.update() == []
+
+
+def test_socket_owner_index_replaced(monkeypatch):
+    index = sockets.SocketOwnerIndex()
+    index.update()
+    # 3756 closed a socket and accepted another one: same number of fds
+    monkeypatch.setattr(sockets, 'socket_fds',
+                        lambda pid: {4932589: 3, 4932599: 7} if pid == 3756
+                        else {4932588: 3, 10808720: 4})
+    assert index.update() == []
+    assert index.owners(4932599) == [3756]
+    assert index.owners(4932588) == [1]
+
+
+def test_socket_owner_index_misses(monkeypatch):
+    index = sockets.SocketOwnerIndex()
+    index.update()
+    scanned = []
+    socket_fds = sockets.socket_fds
+    monkeypatch.setattr(sockets, 'socket_fds',
+                        lambda pid: scanned.append(pid) or socket_fds(pid))
+    assert index.owners(0) == []
+    assert scanned == []
+    assert index.owners(12345) == []
+    assert sorted(scanned) == [1, 3756]
+    # One forced re-scan per retry interval for the whole index
+    assert index.owners(12346) == []
+    assert index.owners(12345) == []
+    assert sorted(scanned) == [1, 3756]
+    assert index.owners_many([4932588, 12347, 0]) == {
+        4932588: [1, 3756], 12347: []}
+    assert sorted(scanned) == [1, 3756]
+    index._rescanned -= index.retry_interval
+    assert index.owners(12345) == []
+    assert sorted(scanned) == [1, 1, 3756, 3756]
+
+
+def test_listeners(proc, monkeypatch):
+    scanned = []
+    socket_fds = net.socket_fds
+    monkeypatch.setattr(net, 'socket_fds',
+                        lambda pid: scanned.append(pid) or socket_fds(pid))
+    assert proc.net.listeners(port=[9150, 9151]) == [
+        Listener(9150, '127.0.0.1', 1, 'systemd'),
+        Listener(9151, '127.0.0.1', 3756, 'dbus-daemon')]
+    assert scanned[0] == 1
+    assert scanned[-1] == 3756
+    assert proc.net.listeners(port=443) == [Listener(443, '::', None, None)]
+    listeners = proc.net.listeners()
+    assert len(listeners) == 8
+    assert [listener.port for listener in listeners] == \
+        sorted(listener.port for listener in listeners)
+
+
+# connection churn
+
+
+def test_tcp_churn(monkeypatch):
+    tracker = churn.TcpChurnTracker([procfs.processes.net.tcp(1)])
+    assert tracker.update(0) is None
+    unchanged = tracker.update(1)
+    assert (unchanged.added, unchanged.removed, unchanged.changed) == \
+        ([], [], [])
+
+    lines = open('data/proc/1/net/tcp').read().splitlines()
+    header, rows = lines[0], [line.split(':', 1)[1] for line in lines[1:]]
+    rows[3] = rows[3].replace(' 0A ', ' 01 ')
+    rows[5] = ' 0100007F:E2A4 0100000A:01BB 01' + rows[5][31:]
+    rows.insert(0, rows.pop(4))
+    lines = [header] + ['%4d:%s' % (slot, row)
+                        for slot, row in enumerate(rows)]
+    monkeypatch.setattr(procfs.core, 'iterlines',
+                        lambda fn, size=65536: iter(lines))
+    result = tracker.update(3)
+    assert [entry.remote_address for entry in result.added] == ['10.0.0.1']
+    assert [entry.local_port for entry in result.removed] == [22]
+    assert [(old.st, new.st) for old, new in result.changed] == \
+        [('LISTEN', 'ESTABLISHED')]
+    assert result.peers() == {'10.0.0.1': {
+        'opened': 1, 'closed': 0, 'opened_per_second': 0.5,
+        'closed_per_second': 0.}}
+    assert tracker.update(4).added == []
+
+
+def test_tcp_churn_time_wait(monkeypatch):
+    row = (' 0100007F:E2A4 0100000A:01BB %s 00000000:00000000 00:00000000 '
+           '00000000  1000        0 %s 1 ffff88003a94e840 100 0 0 10 0')
+    header = open('data/proc/1/net/tcp').readline()
+    lines = [header]
+    monkeypatch.setattr(procfs.core, 'iterlines',
+                        lambda fn, size=65536: iter(lines))
+    tracker = churn.TcpChurnTracker([procfs.processes.net.tcp(1)])
+    tracker.update(0)
+    lines.append('   0:' + row % ('01', '4932590'))
+    opened = tracker.update(1)
+    lines[1] = '   0:' + row % ('06', '0')
+    closing = tracker.update(2)
+    del lines[1]
+    closed = tracker.update(3)
+    assert (len(opened.added), len(opened.removed)) == (1, 0)
+    assert (closing.added, closing.removed) == ([], [])
+    assert [(old.st, new.st) for old, new in closing.changed] == \
+        [('ESTABLISHED', 'TIME_WAIT')]
+    assert [entry.st for entry in closed.removed] == ['TIME_WAIT']
+    peers = [result.peers()['10.0.0.1']
+             for result in (opened, closing, closed) if result.peers()]
+    assert sum(peer.opened for peer in peers) == 1
+    assert sum(peer.closed for peer in peers) == 1
+
+
+# connection aggregation
+
+
+def test_connection_groups(proc, numpy_backend):
+    numpy_backend(connections)
+    by_peer = connections.by_peer(pid=1)
+    assert dict((key, value.connections)
+                for key, value in by_peer.items()) == {
+        ('0.0.0.0', 'LISTEN'): 6, ('::', 'LISTEN'): 2,
+        ('::1', 'ESTABLISHED'): 2}
+    by_port = connections.by_port(pid=1)
+    assert by_port[8080, 'ESTABLISHED'].connections == 1
+    assert by_port[22, 'LISTEN'] == {'connections': 1, 'tx_queue': 0,
+                                     'rx_queue': 0}
+    by_address = connections.group(['local_address'], tables=['tcp'], pid=1)
+    assert by_address == {('127.0.0.1',): {'connections': 4, 'tx_queue': 0,
+                                           'rx_queue': 0},
+                          ('0.0.0.0',): {'connections': 2, 'tx_queue': 0,
+                                         'rx_queue': 0}}
+    with pytest.raises(ValueError):
+        connections.group(['inode'], pid=1)
+
+    lines = [
+        'header',
+        '0: 0100007F:0050 0100000A:A000 01 00000010:00000002 00:0 0 0 0 1',
+        '1: 0100007F:0050 0100000A:A001 01 00000020:00000000 00:0 0 0 0 2',
+        '2: 0100007F:0050 0200000A:A002 08 00000001:00000001 00:0 0 0 0 3',
+    ]
+    table = connections.ConnectionTable(lines)
+    assert len(table) == 3
+    assert table.group(('remote_address', 'state')) == {
+        ('10.0.0.1', 'ESTABLISHED'): {'connections': 2, 'tx_queue': 48,
+                                      'rx_queue': 2},
+        ('10.0.0.2', 'CLOSE_WAIT'): {'connections': 1, 'tx_queue': 1,
+                                     'rx_queue': 1}}
+    assert connections.ConnectionTable(lines[:1]).group(['state']) == {}
+
+
+# smaps
+
+
+def test_smaps_special_mappings(first):
+    assert sorted(first.smaps.keys()) == ['heap', 'stack', 'vdso',
+                                          'vsyscall']
+    assert first.smaps.heap.Rss == 532
+    assert first.smaps.heap.device == {'major': 0, 'minor': 0}
+    assert first.smaps.stack.VmFlags[:2] == ['rd', 'wr']
+
+
+def test_smaps_mappings(first):
+    mappings = list(first.smaps.mappings())
+    assert len(mappings) == 9
+    libc = mappings[4]
+    assert libc.pathname == '/usr/lib/x86_64-linux-gnu/libc.so.6'
+    assert libc.offset == 0x26000
+    assert libc.device == {'major': 0xfe, 'minor': 0}
+    assert libc.perms == 'r-xp'
+    assert mappings[3].pathname == ''
+    assert mappings[2].pathname == '/dev/zero (deleted)'
+    assert sum(mapping.fields.Rss for mapping in mappings) == 2516
+
+
+def test_smaps_aggregate(first):
+    by_type = first.smaps.aggregate(by='type')
+    assert sorted(by_type.keys()) == ['anonymous', 'file', 'heap', 'shared',
+                                      'stack', 'vdso', 'vsyscall', 'vvar']
+    assert sorted(by_type.heap.keys()) == sorted(procfs.processes.SMAPS_FIELDS)
+    assert sum(group.Pss for group in by_type.values()) == 1802
+    by_pathname = first.smaps.aggregate(fields=['Rss'])
+    assert by_pathname['[heap]'] == {'Rss': 532}
+    assert '' in by_pathname
+    with pytest.raises(ValueError):
+        first.smaps.aggregate(by='inode')
+
+
+def test_smaps_totals(first, reads):
+    totals = first.smaps.totals()
+    assert reads == ['/proc/1/smaps_rollup']
+    assert totals == first.smaps_rollup()
+    assert totals.Pss == 1802
+    assert first.smaps.totals(['Rss', 'Swap']) == {'Rss': 2516, 'Swap': 0}
+    # Size is not in smaps_rollup
+    assert first.smaps.totals(['Rss', 'Size']) == {'Rss': 2516,
+                                                   'Size': 5352}
+
+
+# memory accounting
+
+
+def test_read_memory():
+    assert memory.read_memory(1) == (2516, 1802, 1548, 0, True)
+    assert memory.read_memory(3756) == (536, 536, 536, 8, False)
+
+
+def test_memory_report(proc):
+    report = proc.processes.parallel(THREAD_POOL, chunksize=8).memory()
+    assert list(report) == [1, 3756]
+    assert report.cost.processes == 2
+    assert report.cost.rollup == 1
+    assert report.cost.smaps == 1
+    assert report.cost.skipped == 54
+    assert report.process(3756) == {'rss': 536, 'pss': 536, 'uss': 536,
+                                    'swap': 8, 'comm': 'dbus-daemon',
+                                    'uid': 1000}
+    assert report.by_user()[1000].uss == 536
+    assert report.by_user()[0].processes == 1
+    assert report.by_comm()['systemd'].pss == 1802
+    by_tree = report.by_tree()
+    assert by_tree[1] == {'processes': 2, 'rss': 3052, 'pss': 2338,
+                          'uss': 2084, 'swap': 8}
+    assert by_tree[3756].processes == 1
+    assert report.tree.children(1) == [3756]
+    # The tree has the scanned rss, in pages
+    assert report.tree.aggregate(3756).rss == report.table.rss[1] == 288
+    assert report.table.rss_kb[1] == 536
+
+
+def test_memory_report_filtered(proc, executor):
+    report = proc.processes.parallel(executor).uid(1000).memory()
+    assert list(report) == [3756]
+    assert report.cost.skipped == 0
+
+
+# incremental process table
+
+
+def test_process_table(proc, reads, monkeypatch):
+    table = proc.processes.table(['ppid', 'uid', 'utime', 'cmdline'])
+    assert table.refresh() is None
+    assert list(table) == [1, 3756]
+    assert table[3756].comm == 'dbus-daemon'
+    assert table[3756].uid == 1000
+    assert reads.count('/proc/3756/status') == 1
+    del reads[:]
+    events = table.refresh()
+    assert (events.spawned, events.exited) == ([], [])
+    # Only the volatile files of known processes are read
+    assert reads.count('/proc/3756/stat') == 1
+    assert '/proc/3756/status' not in reads
+    assert '/proc/3756/cmdline' not in reads
+
+    replay = procfs.core.readfile
+
+    def reused(fn):
+        data = replay(fn)
+        if fn == '/proc/3756/stat':
+            data = data.replace(' 5406 ', ' 9999 ', 1)
+        return data
+
+    monkeypatch.setattr(procfs.core, 'readfile', reused)
+    previous = table[3756]
+    events = table.refresh()
+    assert len(events.exited) == 1 and events.exited[0] is previous
+    assert [entry.pid for entry in events.spawned] == [3756]
+    assert table[3756].start_time == 9999
+    assert table[3756].uid == 1000
+
+    monkeypatch.setattr(procfs.table, 'list_pids', lambda: [1])
+    events = table.refresh()
+    assert [entry.pid for entry in events.exited] == [3756]
+    assert events.spawned == []
+    assert list(table.columns().pid) == [1]
+
+
+def test_process_table_filtered(proc):
+    with pytest.raises(ValueError):
+        proc.processes.uid(0).table()
+    with pytest.raises(ValueError):
+        table.ProcessTable(['not_a_field'])
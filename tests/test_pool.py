@@ -0,0 +1,94 @@
+"""
+procfs file pool tests
+~~~~~~~~~~~~~~~~~~~~~~
+"""
+
+import os
+import stat
+
+import pytest
+
+from procfs.exceptions import PathNotFoundError, ProcessGoneError
+from procfs.pool import FilePool, PinnedDirectory
+
+
+def test_file_pool_rereads(tmpdir):
+    path = tmpdir.join('counter')
+    path.write('1\n')
+    with FilePool(2, bufsize=4) as pool:
+        assert pool.read(str(path)) == '1\n'
+        path.write('1234567890\n')
+        assert pool.read(str(path)) == '1234567890\n'
+        assert str(path) in pool
+
+
+def test_file_pool_short_reads(tmpdir, monkeypatch):
+    path = tmpdir.join('maps')
+    data = ''.join('%04d\n' % index for index in range(2000))
+    path.write(data)
+    # seq_file-backed files return about a page per read
+    read = os.read
+
+    def short_read(fd, size):
+        return read(fd, min(size, 4000))
+
+    monkeypatch.delattr(os, 'preadv', raising=False)
+    monkeypatch.delattr(os, 'pread', raising=False)
+    monkeypatch.setattr(os, 'read', short_read)
+    with FilePool(bufsize=16384) as pool:
+        assert pool.read(str(path)) == data
+        assert pool.read(str(path)) == data
+
+
+def test_file_pool_large_file(tmpdir):
+    path = tmpdir.join('kallsyms')
+    data = 'x' * 100000
+    path.write(data)
+    with FilePool(bufsize=4096) as pool:
+        assert pool.read(str(path)) == data
+
+
+def test_file_pool_eviction(tmpdir):
+    paths = []
+    for name in ('a', 'b', 'c'):
+        path = tmpdir.join(name)
+        path.write(name)
+        paths.append(str(path))
+    pool = FilePool(2)
+    for path in paths:
+        pool.read(path)
+    pool.read(paths[1])
+    assert len(pool) == 2
+    assert paths[0] not in pool
+    pool.read(paths[0])
+    assert paths[2] not in pool
+    pool.close()
+    assert not len(pool)
+
+
+def test_pinned_directory(tmpdir):
+    directory = tmpdir.mkdir('1')
+    directory.join('stat').write('1 (init) S\n')
+    with PinnedDirectory(str(directory), 1) as pinned:
+        assert pinned.read('stat') == '1 (init) S\n'
+        assert pinned.read(str(directory.join('stat'))) == '1 (init) S\n'
+        assert pinned.mode('stat') == stat.S_IFREG
+        assert pinned.alive()
+        with pytest.raises(PathNotFoundError):
+            pinned.mode('not_a_file')
+        with pytest.raises(OSError):
+            pinned.read('not_a_file')
+        directory.join('cwd').mksymlinkto(tmpdir)
+        directory.join('exe').mksymlinkto(tmpdir.join('deleted'))
+        assert pinned.readlink('cwd') == str(tmpdir)
+        assert pinned.exists('cwd')
+        assert not pinned.exists('exe')
+        # Files of a process that exited can not be found anymore
+        directory.join('stat').remove()
+        assert not pinned.alive()
+        with pytest.raises(ProcessGoneError):
+            pinned.read('stat')
+        with pytest.raises(ProcessGoneError):
+            pinned.mode('stat')
+        with pytest.raises(ProcessGoneError):
+            pinned.readlink('fd')